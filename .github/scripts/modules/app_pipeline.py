@@ -4,12 +4,16 @@ import tempfile
 from datetime import datetime
 
 from utils import logger, find_best_icon, score_icon_path, compute_variant_tag, find_official_source
-from modules.ipa_processing import parse_ipa, get_ipa_sha256, repackage_ipa_with_bundle_id
+from modules.ipa_processing import get_ipa_sha256
+from modules.compute_pool import parse_ipa_file, repackage_ipa_file
 from modules.build_candidates import resolve_release_candidate, resolve_artifact_candidate
 from modules.candidate_fetcher import download_from_artifact, download_from_release
+from modules.remote_zip import read_remote_ipa_info
+from modules.repackage_cache import get_repackage_cache
 from modules.metadata import get_readme_description
-from modules.icons import extract_dominant_color, get_image_quality
+from modules.icons import extract_dominant_color, get_image_quality, select_best_icon
 from modules.source_normalizer import deduplicate_versions, get_skip_versions
+from modules.fingerprints import compute_fingerprint, fingerprint_key
 
 def apply_bundle_id_suffix(bundle_id, app_name, base_name, is_coexist=True):
     if not bundle_id:
@@ -67,7 +71,7 @@ def _apply_passthrough_fields(app_entry, app_config):
         if val not in [None, ""] and not app_entry.get(key):
             app_entry[key] = val
 
-def process_app(app_config, app_entry, client, base_name, is_coexist=True):
+def process_app(app_config, app_entry, client, base_name, is_coexist=True, fingerprints=None):
     repo = app_config['github_repo']
     name = app_config['name']
 
@@ -152,10 +156,19 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
         metadata_updates['artifact_only'] = True
         logger.info(f"Auto-renamed to '{name}' due to artifact build fallback")
 
+    fingerprint = compute_fingerprint(candidate, app_config)
+
     if app_entry:
         app_entry['githubRepo'] = repo
         app_entry['name'] = name
 
+        required_app_fields = {'bundleIdentifier', 'versions', 'appPermissions', 'iconURL'}
+        if fingerprints and required_app_fields.issubset(app_entry.keys()) and \
+                fingerprints.is_unchanged(fingerprint_key(repo, name, is_coexist), fingerprint):
+            _apply_passthrough_fields(app_entry, app_config)
+            logger.info(f"Skipping {name} (upstream fingerprint unchanged at version {version})")
+            return app_entry, metadata_updates
+
         versions_list = app_entry.get('versions') if isinstance(app_entry.get('versions'), list) else []
         latest_version = versions_list[0] if versions_list else {}
         stored_version = latest_version.get('version') or ''
@@ -215,10 +228,16 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
                 is_newer = True
 
         if not is_newer and not os.environ.get('FORCE_UPDATE_ALL') and (has_direct_link or is_cached_url or not direct_url) and not is_generic and not bundle_id_needs_update:
+            probe_urls = [current_download_url, app_entry.get('iconURL')]
+            config_icon = app_config.get('icon_url')
+            if config_icon and config_icon not in ['None', '_No response_'] and app_entry.get('iconURL') != config_icon:
+                probe_urls.append(config_icon)
+            probes = client.head_many(probe_urls, allow_redirects=True, timeout=15)
+
             url_is_alive = True
             if current_download_url:
                 try:
-                    resp = client.head(current_download_url, allow_redirects=True, timeout=15)
+                    resp = probes.get(current_download_url)
                     if resp is None or resp.status_code >= 400:
                         url_is_alive = False
                         logger.warning(f"Download URL for {name} is dead ({resp.status_code if resp else 'None'}), will re-download.")
@@ -231,7 +250,7 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
 
                 current_icon_url = app_entry.get('iconURL')
                 if current_icon_url:
-                    head_resp = client.head(current_icon_url, allow_redirects=True, timeout=15)
+                    head_resp = probes.get(current_icon_url)
                     if head_resp is None or head_resp.status_code >= 400:
                         logger.info(f"Icon URL for {name} returned HTTP {head_resp.status_code if head_resp else 'None'}, searching for replacement...")
                         repo_icons = find_best_icon(repo, client)
@@ -246,7 +265,10 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
 
                 config_icon = app_config.get('icon_url')
                 if config_icon and config_icon not in ['None', '_No response_'] and app_entry.get('iconURL') != config_icon:
-                    head_cfg = client.head(config_icon, allow_redirects=True, timeout=15)
+                    if config_icon in probes:
+                        head_cfg = probes[config_icon]
+                    else:
+                        head_cfg = client.head(config_icon, allow_redirects=True, timeout=15)
                     if head_cfg and head_cfg.status_code < 400:
                         app_entry['iconURL'] = config_icon
                         logger.info(f"Updated icon for {name} from config")
@@ -278,6 +300,8 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
                     ]
 
                 _apply_passthrough_fields(app_entry, app_config)
+                if fingerprints:
+                    fingerprints.set(fingerprint_key(repo, name, is_coexist), fingerprint)
                 logger.info(f"Skipping {name} (Already up to date at version {version})")
                 return app_entry, metadata_updates
 
@@ -314,16 +338,7 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
 
         if not config_icon or config_icon in ['None', '_No response_']:
             repo_icons = find_best_icon(repo, client)
-            best_repo_score = -1
-            best_repo_icon = None
-            if repo_icons:
-                for cand in repo_icons:
-                    q_score, _, _ = get_image_quality(cand, client)
-                    path_score = score_icon_path(cand)
-                    total_score = q_score + path_score
-                    if total_score > best_repo_score:
-                        best_repo_score = total_score
-                        best_repo_icon = cand
+            best_repo_icon, best_repo_score = select_best_icon(repo_icons, client, score_fn=score_icon_path)
 
             if best_repo_icon:
                 if not current_icon:
@@ -364,60 +379,79 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
                     temp_path, current_repo, metadata_updates
                 )
             else:
-                download_from_release(client, download_url, temp_path)
-
-        try:
-            _download_selected_candidate()
-        except Exception as e:
-            if candidate.source == 'release':
-                logger.warning(f"Release download failed for {name} ({e}), falling back to artifacts...")
-                candidate = resolve_artifact_candidate(app_config, client, repo, name, is_coexist, current_repo)
-                if not candidate:
-                    raise
-                workflow_file = candidate.workflow_file
-                workflow_run = candidate.workflow_run
-                artifact = candidate.artifact
-                download_url = candidate.download_url
-                direct_url = candidate.direct_url
-                asset_name = candidate.asset_name
-                release_tag = candidate.release_tag
-                version = candidate.version
-                release_date = candidate.release_date
-                release_timestamp = candidate.release_timestamp
-                version_desc = candidate.version_desc
-                size = candidate.size
-                _download_selected_candidate()
-            else:
-                raise
+                validator = None
+                if candidate.source == 'release' and download_url == candidate.download_url:
+                    validator = {'fingerprint': candidate.fingerprint, 'size': candidate.size, 'sha256': candidate.sha256}
+                download_from_release(client, download_url, temp_path, validator=validator)
 
         is_fresh_download = not is_cached_url
-
         default_bundle_id = f"com.placeholder.{name.lower().replace(' ', '')}"
-        ipa_info = parse_ipa(temp_path, default_bundle_id)
-        if not ipa_info.get('is_valid'):
-            if candidate.source == 'release':
-                logger.warning(f"Downloaded Release asset is not a valid IPA for {name}, falling back to artifacts...")
-                candidate = resolve_artifact_candidate(app_config, client, repo, name, is_coexist, current_repo)
-                if not candidate:
-                    raise Exception("No valid IPA from release and no artifact fallback available")
-                workflow_file = candidate.workflow_file
-                workflow_run = candidate.workflow_run
-                artifact = candidate.artifact
-                download_url = candidate.download_url
-                direct_url = candidate.direct_url
-                asset_name = candidate.asset_name
-                release_tag = candidate.release_tag
-                version = candidate.version
-                release_date = candidate.release_date
-                release_timestamp = candidate.release_timestamp
-                version_desc = candidate.version_desc
-                size = candidate.size
+
+        # Original-variant release IPAs are never repackaged; when GitHub publishes the
+        # asset digest, the metadata can be read via range requests without a download.
+        ipa_info = None
+        remote_sha256 = None
+        if not is_coexist and candidate.source == 'release' and download_url.split('?', 1)[0].lower().endswith('.ipa'):
+            remote_sha256 = candidate.sha256
+            if not remote_sha256 and candidate.asset_id:
+                digest = (client.get_release_asset(repo, candidate.asset_id) or {}).get('digest') or ''
+                remote_sha256 = digest[len('sha256:'):] if digest.startswith('sha256:') else None
+            if remote_sha256:
+                ipa_info = read_remote_ipa_info(client, download_url, default_bundle_id)
+                if not ipa_info or not ipa_info.get('is_valid'):
+                    ipa_info = None
+                    remote_sha256 = None
+
+        if ipa_info is None:
+            try:
                 _download_selected_candidate()
-                ipa_info = parse_ipa(temp_path, default_bundle_id)
-                if not ipa_info.get('is_valid'):
-                    raise Exception("Artifact fallback did not produce a valid IPA")
-            else:
-                raise Exception("Downloaded artifact asset is not a valid IPA")
+            except Exception as e:
+                if candidate.source == 'release':
+                    logger.warning(f"Release download failed for {name} ({e}), falling back to artifacts...")
+                    candidate = resolve_artifact_candidate(app_config, client, repo, name, is_coexist, current_repo)
+                    if not candidate:
+                        raise
+                    workflow_file = candidate.workflow_file
+                    workflow_run = candidate.workflow_run
+                    artifact = candidate.artifact
+                    download_url = candidate.download_url
+                    direct_url = candidate.direct_url
+                    asset_name = candidate.asset_name
+                    release_tag = candidate.release_tag
+                    version = candidate.version
+                    release_date = candidate.release_date
+                    release_timestamp = candidate.release_timestamp
+                    version_desc = candidate.version_desc
+                    size = candidate.size
+                    _download_selected_candidate()
+                else:
+                    raise
+
+            ipa_info = parse_ipa_file(temp_path, default_bundle_id)
+            if not ipa_info.get('is_valid'):
+                if candidate.source == 'release':
+                    logger.warning(f"Downloaded Release asset is not a valid IPA for {name}, falling back to artifacts...")
+                    candidate = resolve_artifact_candidate(app_config, client, repo, name, is_coexist, current_repo)
+                    if not candidate:
+                        raise Exception("No valid IPA from release and no artifact fallback available")
+                    workflow_file = candidate.workflow_file
+                    workflow_run = candidate.workflow_run
+                    artifact = candidate.artifact
+                    download_url = candidate.download_url
+                    direct_url = candidate.direct_url
+                    asset_name = candidate.asset_name
+                    release_tag = candidate.release_tag
+                    version = candidate.version
+                    release_date = candidate.release_date
+                    release_timestamp = candidate.release_timestamp
+                    version_desc = candidate.version_desc
+                    size = candidate.size
+                    _download_selected_candidate()
+                    ipa_info = parse_ipa_file(temp_path, default_bundle_id)
+                    if not ipa_info.get('is_valid'):
+                        raise Exception("Artifact fallback did not produce a valid IPA")
+                else:
+                    raise Exception("Downloaded artifact asset is not a valid IPA")
         ipa_version = ipa_info['version']
         ipa_build = ipa_info['build']
         extracted_bundle_id = ipa_info['bundle_id']
@@ -462,14 +496,30 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
             version = "0.0.0"
             bundle_id = default_bundle_id
 
-        sha256 = get_ipa_sha256(temp_path)
+        sha256 = remote_sha256 or get_ipa_sha256(temp_path)
 
         target_bundle_id, needs_repackage = apply_bundle_id_suffix(bundle_id, name, base_name, is_coexist)
 
-        if needs_repackage and current_repo and client.token and not is_local_validation:
+        repackage_cache = get_repackage_cache()
+        cached_output = None
+        if needs_repackage and current_repo and client.token and not is_local_validation and repackage_cache:
+            cached_output = repackage_cache.get(sha256, target_bundle_id)
+            if cached_output:
+                head_resp = client.head(cached_output['download_url'], allow_redirects=True, timeout=15)
+                if head_resp is None or head_resp.status_code >= 400:
+                    cached_output = None
+
+        if cached_output:
+            logger.info(f"Reusing repackaged IPA for {name}: {cached_output.get('asset_name') or cached_output['download_url']}")
+            sha256 = cached_output['sha256']
+            bundle_id = target_bundle_id
+            download_url = cached_output['download_url']
+            size = cached_output.get('size') or size
+        elif needs_repackage and current_repo and client.token and not is_local_validation:
             logger.info(f"Repackaging IPA for {name} with bundle ID: {target_bundle_id}")
 
-            success, new_sha256 = repackage_ipa_with_bundle_id(temp_path, target_bundle_id)
+            input_sha256 = sha256
+            success, new_sha256 = repackage_ipa_file(temp_path, target_bundle_id)
 
             if success:
                 sha256 = new_sha256
@@ -500,6 +550,9 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
                         download_url = asset['browser_download_url']
                         size = os.path.getsize(temp_path)
                         logger.info(f"Uploaded cached IPA: {cached_asset_name}")
+                        if repackage_cache:
+                            repackage_cache.put(input_sha256, target_bundle_id, sha256, size,
+                                                download_url, asset_name=cached_asset_name)
 
             else:
                 logger.warning(f"Failed to repackage {name}, using original bundle ID")
@@ -610,13 +663,7 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
             else:
                 icon_candidates = find_best_icon(repo, client)
                 if icon_candidates:
-                    best_cand = None
-                    max_q = -1
-                    for cand in icon_candidates:
-                        q_score, _, _ = get_image_quality(cand, client)
-                        if q_score > max_q:
-                            max_q = q_score
-                            best_cand = cand
+                    best_cand, max_q = select_best_icon(icon_candidates, client)
 
                     if best_cand:
                         icon_url = best_cand
@@ -666,4 +713,7 @@ def process_app(app_config, app_entry, client, base_name, is_coexist=True):
         metadata_updates['tag_regex'] = injected_tag_regex
         metadata_updates['pre_release'] = True
 
+    if fingerprints:
+        fingerprints.set(fingerprint_key(repo, name, is_coexist), fingerprint)
+
     return app_entry, metadata_updates
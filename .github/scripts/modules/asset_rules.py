@@ -0,0 +1,107 @@
+import re
+import threading
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from utils import GLOBAL_CONFIG
+
+def _substring_pattern(tokens):
+    """One alternation regex equivalent to any(t in s for t in tokens), or None for no tokens."""
+    if not tokens:
+        return None
+    alternatives = sorted(set(tokens), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(t) for t in alternatives))
+
+class AssetScoringRules:
+    """
+    The release_asset_scoring section of config.yml, compiled once: extension
+    tuples for endswith checks and single regexes for the hint / exclusion token
+    lists. Shared by select_best_ipa and the version URL filter so both apply
+    the same exclusions.
+    """
+
+    __slots__ = ('direct_exts', 'archive_exts', 'exclude_exts', '_hint_re', '_exclude_re')
+
+    def __init__(self, scoring_cfg):
+        scoring_cfg = scoring_cfg or {}
+        self.direct_exts = tuple(scoring_cfg.get('allowed_direct_extensions', ['.ipa']))
+        self.archive_exts = tuple(scoring_cfg.get('allowed_archive_extensions', ['.ipa.zip', '.zip', '.tar', '.tar.gz', '.tgz']))
+        self.exclude_exts = tuple(scoring_cfg.get('exclude_extensions', []))
+        self._hint_re = _substring_pattern(tuple(scoring_cfg.get('archive_hint_tokens', ['ipa', 'ios', 'iphone', 'ipad'])))
+        self._exclude_re = _substring_pattern(tuple(scoring_cfg.get('exclude_tokens', [])))
+
+    def has_archive_hint(self, name_lower):
+        return self._hint_re is not None and self._hint_re.search(name_lower) is not None
+
+    def is_excluded(self, name_lower, ignore_tokens=False):
+        if self.exclude_exts and name_lower.endswith(self.exclude_exts):
+            return True
+        if not ignore_tokens and self._exclude_re is not None and self._exclude_re.search(name_lower):
+            return True
+        return False
+
+    def classify(self, name_lower):
+        """'direct' / 'hinted' for IPA candidates, 'archive' for hintless archives, None if not usable."""
+        ignore_tokens = name_lower.endswith('.ipa') or name_lower.endswith('.ipa.zip')
+        if self.is_excluded(name_lower, ignore_tokens=ignore_tokens):
+            return None
+        if self.direct_exts and name_lower.endswith(self.direct_exts):
+            return 'direct'
+        if self.archive_exts and name_lower.endswith(self.archive_exts):
+            return 'hinted' if self.has_archive_hint(name_lower) else 'archive'
+        return None
+
+    def is_allowed_filename(self, name_lower):
+        """Whether a version download URL's filename is an iOS build (direct IPA or hinted archive)."""
+        if self.exclude_exts and name_lower.endswith(self.exclude_exts):
+            return False
+        if self.direct_exts and name_lower.endswith(self.direct_exts):
+            return True
+        if self._exclude_re is not None and self._exclude_re.search(name_lower):
+            return False
+        if self.archive_exts and name_lower.endswith(self.archive_exts):
+            return self.has_archive_hint(name_lower)
+        return False
+
+    def format_bonus(self, name_lower):
+        if name_lower.endswith('.ipa'):
+            return 250
+        if name_lower.endswith('.ipa.zip'):
+            return 120
+        if name_lower.endswith(self.archive_exts) and self.has_archive_hint(name_lower):
+            return 60
+        return 0
+
+_rules = None
+_rules_source = None
+_rules_lock = threading.Lock()
+
+def get_asset_rules():
+    """Rules for the loaded config, rebuilt only if the release_asset_scoring section object changes."""
+    global _rules, _rules_source
+    scoring_cfg = (GLOBAL_CONFIG or {}).get('release_asset_scoring', {}) or {}
+    with _rules_lock:
+        if _rules is None or _rules_source is not scoring_cfg:
+            _rules = AssetScoringRules(scoring_cfg)
+            _rules_source = scoring_cfg
+        return _rules
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]')
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+@lru_cache(maxsize=4096)
+def name_profile(name):
+    """(normalized name, token set) used for name matching; version-like tokens and 'ipa' are dropped."""
+    lower = name.lower()
+    tokens = set(_TOKEN.findall(lower))
+    tokens.discard('ipa')
+    tokens = frozenset(t for t in tokens if not (t.isdigit() or (t.startswith('v') and t[1:].isdigit())))
+    return _NON_ALNUM.sub('', lower), tokens
+
+@lru_cache(maxsize=8192)
+def name_similarity(app_norm, asset_norm):
+    return SequenceMatcher(None, app_norm, asset_norm).ratio()
+
+@lru_cache(maxsize=256)
+def compile_ipa_regex(pattern):
+    return re.compile(pattern, re.IGNORECASE)
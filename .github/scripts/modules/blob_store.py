@@ -0,0 +1,177 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from modules.cache_store import cache_path, link_or_copy, read_json, write_json_atomic
+
+class BlobStore:
+    """
+    Content-addressed store for downloaded files: objects/<sha256> holds each
+    distinct file once, keys/ maps a download key (URL, artifact id) to the
+    digest it produced plus the validator it was fetched under. Files enter and
+    leave the store as hard links, objects are only ever created by an atomic
+    rename, and eviction is least-recently-used under a byte budget.
+
+    A key stored during this run is always reusable; a key restored from an
+    earlier run only when the caller's validator (asset id, size, digest, ...)
+    matches the one recorded with it.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or cache_path('downloads')
+        self.objects = os.path.join(self.root, 'objects')
+        self.keys = os.path.join(self.root, 'keys')
+        self._this_run = {}
+        self._lock = threading.Lock()
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def _key_path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.keys, digest[:2], f"{digest}.json")
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _object_for(self, sha256, size=None):
+        path = self._object_path(sha256)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if size is not None and st.st_size != size:
+            return None
+        return path
+
+    def lookup(self, key, validator=None):
+        """Returns (object path, sha256) for a reusable cached download, else (None, None)."""
+        with self._lock:
+            current = self._this_run.get(key)
+        if current:
+            path = self._object_for(current)
+            return (path, current) if path else (None, None)
+
+        validator = {k: v for k, v in (validator or {}).items() if v}
+        if not validator:
+            return None, None
+        expected_sha = validator.get('sha256')
+        if expected_sha:
+            # The digest alone identifies the content, whichever key stored it.
+            path = self._object_for(expected_sha, validator.get('size'))
+            if path:
+                self._touch(path)
+                return path, expected_sha
+
+        entry = read_json(self._key_path(key))
+        if not isinstance(entry, dict) or entry.get('key') != key or not entry.get('sha256'):
+            return None, None
+        recorded = entry.get('validator') or {}
+        if any(recorded.get(k) != v for k, v in validator.items() if k != 'sha256'):
+            return None, None
+        if expected_sha and entry['sha256'] != expected_sha:
+            return None, None
+        path = self._object_for(entry['sha256'], entry.get('size'))
+        if not path:
+            return None, None
+        self._touch(path)
+        self._touch(self._key_path(key))
+        return path, entry['sha256']
+
+    def checkout(self, key, dst, validator=None):
+        """Materialize a cached download at dst. Returns its sha256, or None on a miss."""
+        path, sha256 = self.lookup(key, validator)
+        if not path:
+            return None
+        link_or_copy(path, dst)
+        return sha256
+
+    def put(self, key, source_path, sha256, validator=None):
+        """Record source_path under key, adding its content to the store if new. Returns the object path."""
+        if not sha256 or not os.path.exists(source_path):
+            return None
+        path = self._object_for(sha256)
+        if not path:
+            path = self._object_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            os.close(fd)
+            try:
+                os.remove(tmp_path)
+                try:
+                    os.link(source_path, tmp_path)
+                except OSError:
+                    shutil.copy2(source_path, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+                return None
+        else:
+            self._touch(path)
+        with self._lock:
+            self._this_run[key] = sha256
+        validator = {k: v for k, v in (validator or {}).items() if v}
+        if not validator:
+            # Without a validator the key is only trusted for the rest of this run.
+            return path
+        entry = {
+            'key': key,
+            'sha256': sha256,
+            'size': os.path.getsize(path),
+            'validator': validator,
+            'stored_at': time.time(),
+        }
+        write_json_atomic(self._key_path(key), entry)
+        return path
+
+    def evict(self, max_bytes, max_key_age_days=30):
+        """
+        Delete least-recently-used objects until the store fits in max_bytes, and
+        key entries that are old or point at evicted objects. Returns (objects, bytes) removed.
+        """
+        objects = []
+        total = 0
+        for dirpath, _, files in os.walk(self.objects):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    if fn.startswith('.tmp-'):
+                        os.remove(path)
+                        continue
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                objects.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        objects.sort()
+        removed, freed = 0, 0
+        for _, size, path in objects:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+
+        cutoff = time.time() - max_key_age_days * 86400
+        for dirpath, _, files in os.walk(self.keys):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    entry = read_json(path) or {}
+                    sha256 = entry.get('sha256')
+                    if os.path.getmtime(path) < cutoff or not sha256 or not os.path.exists(self._object_path(sha256)):
+                        os.remove(path)
+                except OSError:
+                    continue
+        return removed, freed
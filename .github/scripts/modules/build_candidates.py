@@ -3,61 +3,30 @@ import os
 from dataclasses import dataclass
 from difflib import SequenceMatcher
 from typing import Optional
-from utils import logger, GLOBAL_CONFIG
+from utils import logger
+from modules.asset_rules import compile_ipa_regex, get_asset_rules, name_profile, name_similarity
 
 def select_best_ipa(assets, app_config):
-    def _name(a):
-        return (a.get('name') or '').strip()
-
-    def _lname(a):
-        return _name(a).lower()
-
     ipa_regex = (app_config or {}).get('ipa_regex')
     if ipa_regex:
         try:
-            pat = re.compile(ipa_regex, re.IGNORECASE)
-            assets = [a for a in assets if pat.search(_name(a))]
+            pat = compile_ipa_regex(ipa_regex)
+            assets = [a for a in assets if pat.search((a.get('name') or '').strip())]
         except re.error as e:
             logger.warning(f"Invalid ipa_regex for {app_config.get('name', 'Unknown')}: {e}")
 
-    scoring_cfg = (GLOBAL_CONFIG or {}).get('release_asset_scoring', {}) or {}
-    allowed_direct_exts = tuple(scoring_cfg.get('allowed_direct_extensions', ['.ipa']))
-    allowed_archive_exts = tuple(scoring_cfg.get('allowed_archive_extensions', ['.ipa.zip', '.zip', '.tar', '.tar.gz', '.tgz']))
-    archive_hint_tokens = tuple(scoring_cfg.get('archive_hint_tokens', ['ipa', 'ios', 'iphone', 'ipad']))
-    exclude_exts = tuple(scoring_cfg.get('exclude_extensions', []))
-    exclude_tokens = tuple(scoring_cfg.get('exclude_tokens', []))
-
-    def _has_archive_hint(filename_lower):
-        return any(t in filename_lower for t in archive_hint_tokens)
-
-    def _is_excluded(filename_lower, ignore_tokens=False):
-        if exclude_exts and filename_lower.endswith(exclude_exts):
-            return True
-        if not ignore_tokens and exclude_tokens and any(t in filename_lower for t in exclude_tokens):
-            return True
-        return False
-
+    rules = get_asset_rules()
     ipa_assets = []
     fallback_archives = []
     for a in assets:
-        n = _lname(a)
+        n = (a.get('name') or '').strip().lower()
         if not n:
             continue
-
-        is_direct_ipa = n.endswith('.ipa')
-        is_ipa_wrapper_zip = n.endswith('.ipa.zip')
-        ignore_tokens = is_direct_ipa or is_ipa_wrapper_zip
-
-        if _is_excluded(n, ignore_tokens=ignore_tokens):
-            continue
-        if allowed_direct_exts and n.endswith(allowed_direct_exts):
+        kind = rules.classify(n)
+        if kind in ('direct', 'hinted'):
             ipa_assets.append(a)
-            continue
-        if allowed_archive_exts and n.endswith(allowed_archive_exts):
-            if _has_archive_hint(n):
-                ipa_assets.append(a)
-            else:
-                fallback_archives.append(a)
+        elif kind == 'archive':
+            fallback_archives.append(a)
 
     if not ipa_assets:
         if len(fallback_archives) == 1:
@@ -66,36 +35,16 @@ def select_best_ipa(assets, app_config):
     if len(ipa_assets) == 1:
         return ipa_assets[0]
 
-    def normalize(s):
-        return re.sub(r'[^a-z0-9]', '', s.lower())
-
-    def token_set(s):
-        tokens = set(re.findall(r'[a-z0-9]+', s.lower()))
-        tokens.discard('ipa')
-        tokens = {t for t in tokens if not (t.isdigit() or (t.startswith('v') and t[1:].isdigit()))}
-        return tokens
-
     app_name = app_config['name']
-    app_norm = normalize(app_name)
-    app_tokens = token_set(app_name)
+    app_norm, app_tokens = name_profile(app_name)
 
     scored_assets = []
 
     for asset in ipa_assets:
         asset_name = asset['name']
-        asset_base = asset_name.rsplit('.', 1)[0]
-        asset_norm = normalize(asset_base)
-        asset_tokens = token_set(asset_base)
-
-        score = 0
+        asset_norm, asset_tokens = name_profile(asset_name.rsplit('.', 1)[0])
 
-        lower_full = (asset_name or '').lower()
-        if lower_full.endswith('.ipa'):
-            score += 250
-        elif lower_full.endswith('.ipa.zip'):
-            score += 120
-        elif lower_full.endswith(allowed_archive_exts) and any(t in lower_full for t in archive_hint_tokens):
-            score += 60
+        score = rules.format_bonus((asset_name or '').lower())
 
         if app_norm == asset_norm:
             score += 1000
@@ -115,8 +64,7 @@ def select_best_ipa(assets, app_config):
             if surprise:
                 score -= len(surprise) * 50
 
-        similarity = SequenceMatcher(None, app_norm, asset_norm).ratio()
-        score += int(similarity * 50)
+        score += int(name_similarity(app_norm, asset_norm) * 50)
 
         scored_assets.append({
             'score': score,
@@ -151,6 +99,9 @@ class BuildCandidate:
     release_timestamp: str
     version_desc: str
     size: int
+    fingerprint: Optional[str] = None
+    asset_id: Optional[int] = None
+    sha256: Optional[str] = None
 
 def resolve_release_candidate(app_config, client, repo):
     preferred = app_config.get('pre_release', False)
@@ -179,6 +130,7 @@ def resolve_release_candidate(app_config, client, repo):
     release_timestamp = actual_date or release.get('published_at', '')
     version_desc = release['body'] or "Update"
     size = ipa_asset['size']
+    digest = ipa_asset.get('digest') or ''
 
     return BuildCandidate(
         source='release',
@@ -194,6 +146,9 @@ def resolve_release_candidate(app_config, client, repo):
         release_timestamp=release_timestamp,
         version_desc=version_desc,
         size=size,
+        fingerprint=f"release:{release.get('id')}:{ipa_asset.get('id')}:{ipa_asset.get('updated_at')}",
+        asset_id=ipa_asset.get('id'),
+        sha256=digest[len('sha256:'):] if digest.startswith('sha256:') else None,
     )
 
 def resolve_artifact_candidate(app_config, client, repo, name, is_coexist, current_repo):
@@ -294,6 +249,7 @@ def resolve_artifact_candidate(app_config, client, repo, name, is_coexist, curre
                 release_timestamp=release_timestamp,
                 version_desc=f"Nightly build from branch {preferred_branch}",
                 size=0,
+                fingerprint=f"commit:{commit.get('sha')}" if commit.get('sha') else None,
             )
 
         return None
@@ -373,4 +329,5 @@ def resolve_artifact_candidate(app_config, client, repo, name, is_coexist, curre
         release_timestamp=release_timestamp,
         version_desc=version_desc,
         size=size,
+        fingerprint=f"artifact:{workflow_run.get('id')}:{artifact.get('id')}",
     )
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+def cache_root():
+    """Root of the persistent cache (restored between workflow runs by actions/cache)."""
+    configured = os.environ.get('SIDELOAD_CACHE_DIR')
+    if configured:
+        return os.path.expanduser(configured)
+    return os.path.join(os.path.expanduser('~'), '.cache', 'ios-sideload-source')
+
+def cache_path(*parts):
+    path = os.path.join(cache_root(), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def link_or_copy(src, dst):
+    """Materialize src at dst as a hard link, falling back to a copy across filesystems."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+def write_json_atomic(path, data):
+    dir_path = os.path.dirname(path) or '.'
+    os.makedirs(dir_path, exist_ok=True)
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=dir_path, delete=False, encoding='utf-8') as tmp:
+            json.dump(data, tmp, ensure_ascii=False, separators=(',', ':'))
+            tmp_path = tmp.name
+        os.replace(tmp_path, path)
+        return True
+    except Exception:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+class HttpCache:
+    """
+    Directory store of JSON response bodies keyed by request URL, together with
+    the ETag / Last-Modified validators needed to revalidate them with a
+    conditional request. One file per URL so concurrent workers never contend.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or cache_path('http')
+
+    def _entry_path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def load(self, key):
+        entry = read_json(self._entry_path(key))
+        if not isinstance(entry, dict) or entry.get('key') != key:
+            return None
+        return entry
+
+    def store(self, key, body, etag=None, last_modified=None):
+        if not etag and not last_modified:
+            return False
+        entry = {
+            'key': key,
+            'etag': etag,
+            'last_modified': last_modified,
+            'body': body,
+        }
+        return write_json_atomic(self._entry_path(key), entry)
+
+    def touch(self, key):
+        try:
+            os.utime(self._entry_path(key))
+        except OSError:
+            pass
+
+    def prune(self, max_age_days=14):
+        """Remove entries that have not been stored or revalidated recently."""
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
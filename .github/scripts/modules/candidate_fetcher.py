@@ -1,12 +1,15 @@
+import hashlib
 import os
 import shutil
 import tempfile
 import tarfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from utils import logger
-from modules.ipa_processing import parse_ipa, package_app_to_ipa
+from modules.ipa_processing import get_ipa_sha256, package_app_to_ipa, remember_sha256
+from modules.compute_pool import parse_ipa_file
 
 def _zip_likely_contains_ipa_remote(client, url, max_tail_bytes=1024 * 1024):
     try:
@@ -34,7 +37,96 @@ def _zip_likely_contains_ipa_remote(client, url, max_tail_bytes=1024 * 1024):
     except Exception:
         return None
 
-def _download_stream_to_file(client, url, out_path, timeout=300, tries=3):
+class _RangesUnsupported(Exception):
+    pass
+
+def _parallel_download_size(client, url, expected_size=None):
+    """
+    Total size when url is large enough and served with byte ranges, else None
+    (single stream). Only downloads with a size hint of at least
+    PARALLEL_DOWNLOAD_MIN_BYTES are probed; without one no HEAD is sent.
+    """
+    connections = int(os.environ.get('DOWNLOAD_CONNECTIONS', '4'))
+    min_bytes = int(os.environ.get('PARALLEL_DOWNLOAD_MIN_BYTES', str(64 * 1024 * 1024)))
+    if connections <= 1 or not client or not hasattr(os, 'pwrite'):
+        return None
+    if not expected_size or expected_size < min_bytes:
+        return None
+    head = client.head(url, allow_redirects=True, timeout=30)
+    if head is None or head.status_code >= 400:
+        return None
+    if head.headers.get('Accept-Ranges', '').lower() != 'bytes' or head.headers.get('Content-Encoding'):
+        return None
+    length = head.headers.get('Content-Length', '')
+    if not length.isdigit():
+        return None
+    total = int(length)
+    if total != expected_size:
+        logger.warning(f"Size mismatch for {url}: server reports {total}, release lists {expected_size}")
+        return None
+    return total
+
+def _fetch_range(client, url, fd, start, end, timeout, tries):
+    """Fetch bytes start..end (inclusive) into fd, resuming from the last written byte on failure."""
+    pos = start
+    last_err = None
+    for attempt in range(1, tries + 1):
+        r = None
+        try:
+            r = client.get(url, headers={'Range': f"bytes={pos}-{end}", 'Accept-Encoding': 'identity'},
+                           stream=True, timeout=timeout)
+            if not r:
+                raise Exception("no response")
+            if r.status_code != 206 or not r.headers.get('Content-Range', '').startswith(f"bytes {pos}-"):
+                raise _RangesUnsupported(f"status {r.status_code}")
+            for chunk in r.iter_content(chunk_size=1024 * 256):
+                if not chunk:
+                    continue
+                if pos + len(chunk) > end + 1:
+                    raise Exception("server sent more than the requested range")
+                os.pwrite(fd, chunk, pos)
+                pos += len(chunk)
+            if pos != end + 1:
+                raise Exception(f"range ended at {pos}, expected {end + 1}")
+            return
+        except _RangesUnsupported:
+            raise
+        except Exception as e:
+            last_err = e
+            logger.warning(f"Range {start}-{end} attempt {attempt}/{tries} failed for {url} at byte {pos}: {e}")
+        finally:
+            if r is not None:
+                r.close()
+    raise Exception(f"Range {start}-{end} failed after {tries} attempts ({last_err})")
+
+def _download_ranges(client, url, out_path, total, timeout, tries):
+    """Download url into a preallocated out_path using parallel byte ranges."""
+    connections = int(os.environ.get('DOWNLOAD_CONNECTIONS', '4'))
+    part = -(-total // connections)
+    ranges = [(start, min(start + part, total) - 1) for start in range(0, total, part)]
+    logger.info(f"Downloading {url} ({total // (1024 * 1024)} MB) over {len(ranges)} connections")
+    fd = os.open(out_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            os.posix_fallocate(fd, 0, total)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, total)
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="range") as pool:
+            futures = [pool.submit(_fetch_range, client, url, fd, start, end, timeout, tries) for start, end in ranges]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+    if os.path.getsize(out_path) != total:
+        raise Exception(f"downloaded size {os.path.getsize(out_path)} != {total}")
+
+def _download_stream_to_file(client, url, out_path, timeout=300, tries=3, expected_size=None):
+    """
+    Download url to out_path and return its sha256. Large files served with byte
+    ranges are fetched over several connections (failed ranges resume where they
+    stopped); everything else, or a failed parallel attempt, uses one stream.
+    The result is checked against Content-Length and expected_size.
+    """
     try:
         env_timeout = os.environ.get('DOWNLOAD_TIMEOUT')
         if env_timeout:
@@ -46,6 +138,20 @@ def _download_stream_to_file(client, url, out_path, timeout=300, tries=3):
         timeout = min(timeout, 90)
         tries = min(tries, 2)
 
+    total = _parallel_download_size(client, url, expected_size)
+    if total:
+        try:
+            _download_ranges(client, url, out_path, total, timeout, tries)
+            return get_ipa_sha256(out_path)
+        except _RangesUnsupported as e:
+            logger.info(f"Range requests refused for {url} ({e}), using a single stream")
+        except Exception as e:
+            logger.warning(f"Parallel download failed for {url}: {e}, using a single stream")
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+
     last_err = None
     for attempt in range(1, tries + 1):
         r = None
@@ -53,11 +159,22 @@ def _download_stream_to_file(client, url, out_path, timeout=300, tries=3):
             r = client.get(url, stream=True, timeout=timeout)
             if not r:
                 raise Exception("no response")
+            sha256 = hashlib.sha256()
+            written = 0
             with open(out_path, 'wb') as f:
                 for chunk in r.iter_content(chunk_size=1024 * 256):
                     if chunk:
                         f.write(chunk)
-            return True
+                        sha256.update(chunk)
+                        written += len(chunk)
+            length = r.headers.get('Content-Length', '')
+            if length.isdigit() and not r.headers.get('Content-Encoding') and written != int(length):
+                raise Exception(f"received {written} of {length} bytes")
+            if expected_size and written != expected_size:
+                raise Exception(f"received {written} bytes, release lists {expected_size}")
+            digest = sha256.hexdigest()
+            remember_sha256(out_path, digest)
+            return digest
         except Exception as e:
             last_err = e
             try:
@@ -74,24 +191,68 @@ def _download_stream_to_file(client, url, out_path, timeout=300, tries=3):
                 pass
     raise Exception(f"Failed to download after {tries} attempts: {url} ({last_err})")
 
-def _try_cached_download(client, cache_key, out_path):
-    if not client:
-        return False
-    cached = client.get_cached_download(cache_key)
-    if cached and os.path.exists(cached):
-        shutil.copy2(cached, out_path)
-        return True
-    return False
+def _detach_output(path):
+    """Drop an output path that is hard-linked into the download cache before rewriting it in place."""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError:
+        pass
 
-def _download_with_cache(client, url, out_path, timeout=300, tries=3):
+def _download_with_cache(client, url, out_path, timeout=300, tries=3, validator=None):
+    """
+    Download url to out_path through the client's download store. A copy cached
+    by an earlier run is only reused when validator (asset id / size / sha256
+    of the expected content) matches what it was stored with.
+    """
     cache_key = f"url:{url}"
-    if _try_cached_download(client, cache_key, out_path):
+    if not client:
+        _download_stream_to_file(client, url, out_path, timeout=timeout, tries=tries,
+                                 expected_size=(validator or {}).get('size'))
         return True
-    _download_stream_to_file(client, url, out_path, timeout=timeout, tries=tries)
-    if client:
-        client.cache_download_file(cache_key, out_path)
+
+    def _fetch():
+        digest = _download_stream_to_file(client, url, out_path, timeout=timeout, tries=tries,
+                                          expected_size=(validator or {}).get('size'))
+        client.cache_download_file(cache_key, out_path, digest, validator)
+        return digest
+
+    for _ in range(2):
+        digest = client.checkout_download(cache_key, out_path, validator)
+        if digest:
+            remember_sha256(out_path, digest)
+            return True
+        # Concurrent passes (original and coexist) downloading the same URL share one fetch;
+        # the others check the result out of the download store.
+        digest, leader = client.inflight.do(cache_key, _fetch)
+        if leader:
+            return True
+    _fetch()
     return True
 
+def _extract_zip_member(z, member, out_path):
+    with z.open(member, 'r') as src, open(out_path, 'wb') as f:
+        shutil.copyfileobj(src, f, 1024 * 1024)
+
+def _extract_app_from_zip(z, dest_dir):
+    """Extract only the shallowest .app bundle in the archive. Returns its local path or None."""
+    best = None
+    for n in z.namelist():
+        parts = n.split('/')
+        for i, part in enumerate(parts[:-1]):
+            if part.lower().endswith('.app'):
+                prefix = '/'.join(parts[:i + 1]) + '/'
+                if best is None or (prefix.count('/'), prefix) < (best.count('/'), best):
+                    best = prefix
+                break
+    if not best:
+        return None
+    for info in z.infolist():
+        if info.filename.startswith(best):
+            z.extract(info, dest_dir)
+    app_path = os.path.join(dest_dir, *best.rstrip('/').split('/'))
+    return app_path if os.path.isdir(app_path) else None
+
 def upload_to_cached_release(client, current_repo, tag, release_name, release_body,
                              file_path, asset_name, bundle_id=None, app_name=None):
     if not current_repo or not client.token:
@@ -113,87 +274,73 @@ def upload_to_cached_release(client, current_repo, tag, release_name, release_bo
 def download_from_artifact(client, repo, artifact, name, app_entry,
                            release_tag, release_date, asset_name, download_url,
                            temp_path, current_repo, metadata_updates):
+    _detach_output(temp_path)
     upload_success = False
     local_ready = False
 
-    content = None
-    if client.token and artifact and artifact.get('id'):
-        try:
-            content = client.download_artifact(repo, artifact['id'])
-        except Exception as e:
-            logger.warning(f"Failed to download artifact via API: {e}")
-
-    if content:
-        def _best_ipa_in_zip(namelist):
-            cands = [n for n in namelist if n.lower().endswith('.ipa')]
-            if not cands:
-                return None
-            if len(cands) == 1:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = os.path.join(tmp_dir, "artifact.zip")
+        have_zip = False
+        if client.token and artifact and artifact.get('id'):
+            try:
+                have_zip = client.download_artifact(repo, artifact['id'], zip_path)
+            except Exception as e:
+                logger.warning(f"Failed to download artifact via API: {e}")
+
+        if have_zip:
+            def _best_ipa_in_zip(namelist):
+                cands = [n for n in namelist if n.lower().endswith('.ipa')]
+                if not cands:
+                    return None
+                if len(cands) == 1:
+                    return cands[0]
+                hint = (artifact.get('name') if isinstance(artifact, dict) else '') or ''
+                hint_base = os.path.basename(hint).lower()
+                app_base = (name or '').lower()
+
+                def score(n):
+                    base = os.path.basename(n).lower()
+                    s = 0
+                    if hint_base and hint_base in base:
+                        s += 50
+                    if app_base and app_base.replace(' ', '') in base.replace(' ', ''):
+                        s += 30
+                    s -= len(base) / 100
+                    return s
+
+                cands.sort(key=lambda n: (-score(n), len(n), n))
                 return cands[0]
-            hint = (artifact.get('name') if isinstance(artifact, dict) else '') or ''
-            hint_base = os.path.basename(hint).lower()
-            app_base = (name or '').lower()
-
-            def score(n):
-                base = os.path.basename(n).lower()
-                s = 0
-                if hint_base and hint_base in base:
-                    s += 50
-                if app_base and app_base.replace(' ', '') in base.replace(' ', ''):
-                    s += 30
-                s -= len(base) / 100
-                return s
-
-            cands.sort(key=lambda n: (-score(n), len(n), n))
-            return cands[0]
-
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            zip_path = os.path.join(tmp_dir, "artifact.zip")
-            with open(zip_path, 'wb') as f:
-                f.write(content)
 
+            target_ipa = None
             with zipfile.ZipFile(zip_path, 'r') as z:
-                z.extractall(tmp_dir)
-
                 best_entry = _best_ipa_in_zip(z.namelist())
-                ipa_in_zip = os.path.join(tmp_dir, best_entry) if best_entry else None
-                app_in_zip = None
-                if not ipa_in_zip:
-                    for root, dirs, _ in os.walk(tmp_dir):
-                        for d in dirs:
-                            if d.lower().endswith('.app'):
-                                app_in_zip = os.path.join(root, d)
-                                break
-                        if app_in_zip:
-                            break
-
-                target_ipa = None
-                if ipa_in_zip:
-                    target_ipa = ipa_in_zip
-                elif app_in_zip:
-                    repack_path = os.path.join(tmp_dir, f"{name}.ipa")
-                    if package_app_to_ipa(app_in_zip, repack_path):
-                        target_ipa = repack_path
-
-                if target_ipa:
-                    shutil.copy2(target_ipa, temp_path)
-                    local_ready = True
-                    ipa_info = parse_ipa(
-                        target_ipa,
-                        app_entry.get('bundleIdentifier') if app_entry else None
-                    )
-                    bid_ipa = ipa_info['bundle_id']
-
-                    url = upload_to_cached_release(
-                        client, current_repo, release_tag,
-                        f"Builds ({datetime.now().strftime('%Y-%m-%d')})",
-                        "Build IPAs for optimized distribution.",
-                        target_ipa, asset_name, bundle_id=bid_ipa, app_name=name
-                    )
-                    if url:
-                        download_url = url
-                        upload_success = True
-                        logger.info(f"Uploaded {asset_name} to {release_tag}")
+                if best_entry:
+                    _extract_zip_member(z, best_entry, temp_path)
+                    target_ipa = temp_path
+                else:
+                    app_in_zip = _extract_app_from_zip(z, tmp_dir)
+                    if app_in_zip and package_app_to_ipa(app_in_zip, temp_path):
+                        target_ipa = temp_path
+            os.remove(zip_path)
+
+            if target_ipa:
+                local_ready = True
+                ipa_info = parse_ipa_file(
+                    target_ipa,
+                    app_entry.get('bundleIdentifier') if app_entry else None
+                )
+                bid_ipa = ipa_info['bundle_id']
+
+                url = upload_to_cached_release(
+                    client, current_repo, release_tag,
+                    f"Builds ({datetime.now().strftime('%Y-%m-%d')})",
+                    "Build IPAs for optimized distribution.",
+                    target_ipa, asset_name, bundle_id=bid_ipa, app_name=name
+                )
+                if url:
+                    download_url = url
+                    upload_success = True
+                    logger.info(f"Uploaded {asset_name} to {release_tag}")
 
     if local_ready and not upload_success:
         fallback_url = None
@@ -230,24 +377,15 @@ def download_from_artifact(client, repo, artifact, name, app_entry,
                 with zipfile.ZipFile(zip_path) as z:
                     ipa_entry = next((n for n in z.namelist() if n.lower().endswith('.ipa')), None)
                     if ipa_entry:
-                        with open(temp_path, 'wb') as f:
-                            f.write(z.read(ipa_entry))
+                        _extract_zip_member(z, ipa_entry, temp_path)
                     else:
-                        z.extractall(tmp_dir)
-                        app_in_zip = None
-                        for root, dirs, _ in os.walk(tmp_dir):
-                            for d in dirs:
-                                if d.lower().endswith('.app'):
-                                    app_in_zip = os.path.join(root, d)
-                                    break
-                            if app_in_zip:
-                                break
+                        app_in_zip = _extract_app_from_zip(z, tmp_dir)
                         if not app_in_zip:
                             raise Exception(f"No IPA/.app found inside artifact ZIP for {name}")
                         if not package_app_to_ipa(app_in_zip, temp_path):
                             raise Exception(f"Failed to package .app into IPA for {name}")
 
-                ipa_info = parse_ipa(
+                ipa_info = parse_ipa_file(
                     temp_path,
                     app_entry.get('bundleIdentifier') if app_entry else None
                 )
@@ -267,11 +405,12 @@ def download_from_artifact(client, repo, artifact, name, app_entry,
 
     return download_url
 
-def download_from_release(client, download_url, temp_path):
+def download_from_release(client, download_url, temp_path, validator=None):
+    _detach_output(temp_path)
     is_ipa = download_url.lower().endswith('.ipa')
 
     if is_ipa:
-        _download_with_cache(client, download_url, temp_path, timeout=300, tries=3)
+        _download_with_cache(client, download_url, temp_path, timeout=300, tries=3, validator=validator)
         return
 
     def _best_ipa_entry(names):
@@ -295,7 +434,7 @@ def download_from_release(client, download_url, temp_path):
                 raise Exception(f"No IPA found inside archive: {download_url}")
         with tempfile.TemporaryDirectory() as tmp_dir:
             archive_path = os.path.join(tmp_dir, "release_archive")
-            _download_with_cache(client, download_url, archive_path, timeout=300, tries=3)
+            _download_with_cache(client, download_url, archive_path, timeout=300, tries=3, validator=validator)
 
             if is_zip:
                 try:
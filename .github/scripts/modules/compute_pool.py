@@ -0,0 +1,98 @@
+import atexit
+import copy
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils import logger
+from modules.singleflight import SingleFlight
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_disabled = False
+
+def compute_workers():
+    configured = os.environ.get('COMPUTE_WORKERS')
+    if configured is not None:
+        return max(0, int(configured))
+    return os.cpu_count() or 1
+
+def _get_executor():
+    global _executor, _slots, _disabled
+    with _lock:
+        if _disabled:
+            return None
+        if _executor is None:
+            workers = compute_workers()
+            if workers <= 0:
+                _disabled = True
+                return None
+            depth = int(os.environ.get('COMPUTE_QUEUE_DEPTH', str(workers * 2)))
+            # spawn, not fork: the parent holds live sockets and worker threads.
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(max(1, depth))
+        return _executor
+
+def run_compute(fn, *args):
+    """
+    Run a CPU-bound, picklable call (IPA parsing, repackaging, image analysis)
+    in the process pool so network threads are not serialized behind the GIL.
+    At most COMPUTE_QUEUE_DEPTH calls are queued at once; the call runs inline
+    when the pool is disabled (COMPUTE_WORKERS=0) or has broken.
+    """
+    global _disabled
+    executor = _get_executor()
+    if executor is None:
+        return fn(*args)
+
+    _slots.acquire()
+    try:
+        return executor.submit(fn, *args).result()
+    except BrokenProcessPool:
+        logger.warning("Compute pool broke, running CPU-bound work inline from now on")
+        with _lock:
+            _disabled = True
+        return fn(*args)
+    finally:
+        _slots.release()
+
+_parse_memo = {}
+_parse_flight = SingleFlight()
+
+def parse_ipa_file(ipa_path, default_bundle_id):
+    """
+    Parse an IPA, sharing the result between passes that hold the same content:
+    keyed by the sha256 when it is already known (recorded while downloading),
+    otherwise by file identity, which hard-linked checkouts share. The file is
+    never read just to build the key.
+    """
+    from modules.ipa_processing import _file_identity, known_sha256, parse_ipa
+    digest = known_sha256(ipa_path)
+    key = (digest or _file_identity(ipa_path), default_bundle_id)
+    with _lock:
+        cached = _parse_memo.get(key)
+    if cached is None:
+        cached, _ = _parse_flight.do(key, run_compute, parse_ipa, ipa_path, default_bundle_id)
+        with _lock:
+            _parse_memo[key] = cached
+    return copy.deepcopy(cached)
+
+def repackage_ipa_file(ipa_path, new_bundle_id):
+    from modules.ipa_processing import repackage_ipa_with_bundle_id, remember_sha256
+    success, sha256 = run_compute(repackage_ipa_with_bundle_id, ipa_path, new_bundle_id)
+    if success and sha256:
+        # The digest was memoized in the worker process; record it here too.
+        remember_sha256(ipa_path, sha256)
+    return success, sha256
+
+def shutdown_compute_pool():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+atexit.register(shutdown_compute_pool)
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from utils import load_json, save_json
+
+def compute_fingerprint(candidate, app_config):
+    """Digest of the upstream build identity plus the app's config entry."""
+    if not candidate or not candidate.fingerprint:
+        return None
+    payload = json.dumps([candidate.fingerprint, app_config], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def fingerprint_key(repo, name, is_coexist):
+    return f"{repo}::{name}::{'coexist' if is_coexist else 'original'}"
+
+class FingerprintStore:
+    """
+    Upstream fingerprints per app variant, kept next to the source files. Only
+    digests are stored (no timestamps), so the file changes only when upstream
+    does; full revalidation is scheduled from the key hash and the current hour.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        data = load_json(path) if os.path.exists(path) else {}
+        self._data = data if isinstance(data, dict) else {}
+        self._original = dict(self._data)
+        self._lock = threading.Lock()
+        self.revalidate_hours = int(os.environ.get('FINGERPRINT_REVALIDATE_HOURS', '24'))
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, fingerprint):
+        if not fingerprint:
+            return
+        with self._lock:
+            self._data[key] = fingerprint
+
+    def is_unchanged(self, key, fingerprint):
+        if not fingerprint or self.revalidate_hours <= 0 or os.environ.get('FORCE_UPDATE_ALL'):
+            return False
+        if self.get(key) != fingerprint:
+            return False
+        hour = int(time.time() // 3600)
+        due = zlib.crc32(key.encode('utf-8')) % self.revalidate_hours == hour % self.revalidate_hours
+        return not due
+
+    def save(self, valid_prefixes=None):
+        with self._lock:
+            data = self._data
+            if valid_prefixes is not None:
+                data = {k: v for k, v in data.items() if k.rsplit('::', 1)[0] in valid_prefixes}
+            data = dict(sorted(data.items()))
+            if data == self._original:
+                return False
+            save_json(self.path, data)
+            self._original = dict(data)
+            return True
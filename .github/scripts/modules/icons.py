@@ -1,43 +1,242 @@
+import hashlib
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
+import numpy as np
 from PIL import Image
 
 from utils import logger
+from modules.cache_store import HttpCache, cache_path, read_json, write_json_atomic
+from modules.compute_pool import run_compute
 
-def extract_dominant_color(image_url, client):
-    if not image_url or not image_url.startswith(('http://', 'https://')):
-        return None
+# Bump when the analysis below changes so cached results are recomputed.
+ICON_ANALYSIS_VERSION = 2
+
+_PROBE_BYTES = 16 * 1024
+
+# 4 bits per channel: a 16x16x16 colour histogram.
+_QUANT_SHIFT = 4
+_QUANT_LEVELS = 256 >> _QUANT_SHIFT
+
+def _dominant_color(rgba):
+    """
+    Dominant colour of an RGBA array: opaque, non-white, non-black pixels are
+    bucketed into a quantized histogram, counts are smoothed over neighbouring
+    buckets so near-identical shades vote together, and the result is the mean
+    colour of the winning bucket.
+    """
+    pixels = rgba.reshape(-1, 4)
+    rgb = pixels[:, :3]
+    keep = (pixels[:, 3] >= 10) & ~(rgb > 240).all(axis=1) & ~(rgb < 15).all(axis=1)
+    rgb = rgb[keep]
+    if not len(rgb):
+        return '#000000'
+
+    q = rgb >> _QUANT_SHIFT
+    bins = (q[:, 0].astype(np.int32) * _QUANT_LEVELS + q[:, 1]) * _QUANT_LEVELS + q[:, 2]
+    hist = np.bincount(bins, minlength=_QUANT_LEVELS ** 3).reshape((_QUANT_LEVELS,) * 3)
+
+    padded = np.pad(hist, 1)
+    smoothed = np.zeros_like(hist)
+    for dr in range(3):
+        for dg in range(3):
+            for db in range(3):
+                smoothed += padded[dr:dr + _QUANT_LEVELS, dg:dg + _QUANT_LEVELS, db:db + _QUANT_LEVELS]
+    # Only buckets that actually hold pixels can win.
+    smoothed[hist == 0] = 0
+
+    winner = int(np.argmax(smoothed))
+    r, g, b = (int(c) for c in rgb[bins == winner].mean(axis=0).round())
+    return '#{:02x}{:02x}{:02x}'.format(r, g, b).upper()
+
+def _edge_transparency(img, rgba):
+    """Whether any corner or edge midpoint is (partly) transparent."""
+    if not (img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)):
+        return False
+    width, height = img.size
+    xs = np.array([0, width - 1, 0, width - 1, width // 2, 0, width - 1, width // 2])
+    ys = np.array([0, 0, height - 1, height - 1, 0, height // 2, height // 2, height - 1])
+    alpha = np.asarray(rgba.getchannel('A'))
+    return bool((alpha[ys, xs] < 250).any())
+
+def _quality_for(width, height, has_transparency):
+    aspect_ratio = width / height
+    is_square = 0.95 <= aspect_ratio <= 1.05
+
+    quality = 0
+    if is_square:
+        quality += 50
+    if not has_transparency:
+        quality += 50
+
+    res_score = min(100, (width * height) / (1024 * 1024) * 100)
+    quality += res_score
+
+    if is_square and not has_transparency:
+        quality += 50
+        if width >= 512:
+            quality += 50
+
+    return quality
 
+def _analyze_bytes(data):
+    img = Image.open(BytesIO(data))
+    width, height = img.size
+    is_square = 0.95 <= width / height <= 1.05
+    rgba = img.convert("RGBA")
+    has_transparency = _edge_transparency(img, rgba)
     try:
-        response = client.get(image_url, timeout=10)
+        # A strided ~100x100 sample; no resampling, so edges do not blend into new colours.
+        step = max(1, -(-max(width, height) // 100))
+        dominant_color = _dominant_color(np.asarray(rgba)[::step, ::step])
+    except Exception:
+        dominant_color = None
+    return {
+        'version': ICON_ANALYSIS_VERSION,
+        'quality': _quality_for(width, height, has_transparency),
+        'is_square': is_square,
+        'has_transparency': has_transparency,
+        'width': width,
+        'height': height,
+        'dominant_color': dominant_color,
+    }
+
+def _analyze_batch(blobs):
+    """Analyze several images in one call (one compute-pool round trip)."""
+    results = []
+    for data in blobs:
+        try:
+            results.append(_analyze_bytes(data))
+        except Exception as e:
+            results.append(e)
+    return results
+
+class IconAnalysisCache:
+    """
+    Icon analysis results, remembered for the run by URL and persisted across
+    runs by URL (with the ETag / Last-Modified to revalidate it) and by content
+    hash, so an icon is downloaded and decoded at most once per change.
+    """
+
+    def __init__(self):
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.persistent = os.environ.get('ICON_CACHE', '1') != '0'
+        self.by_url = HttpCache(cache_path('icons', 'url')) if self.persistent else None
+        self._hash_root = cache_path('icons', 'content') if self.persistent else None
+
+    def _content_path(self, digest):
+        return os.path.join(self._hash_root, digest[:2], f"{digest}.json")
+
+    def _fetch(self, image_url, client):
+        """Returns (analysis, None) when known, (None, (data, digest, response)) when it must be computed."""
+        entry = self.by_url.load(image_url) if self.by_url else None
+        if entry and (entry.get('body') or {}).get('version') != ICON_ANALYSIS_VERSION:
+            entry = None
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = client.get(image_url, timeout=10, headers=headers)
         if not response:
-            return None
+            return None, None
+        if response.status_code == 304 and entry:
+            self.by_url.touch(image_url)
+            return entry['body'], None
 
-        img = Image.open(BytesIO(response.content))
-        img = img.convert("RGBA")
-        img = img.resize((100, 100))
+        data = response.content
+        digest = hashlib.sha256(data).hexdigest()
+        content_path = self._content_path(digest) if self._hash_root else None
+        analysis = read_json(content_path) if content_path else None
+        if isinstance(analysis, dict) and analysis.get('version') == ICON_ANALYSIS_VERSION:
+            # prune() goes by mtime, so mark the entry as still in use.
+            try:
+                os.utime(content_path)
+            except OSError:
+                pass
+            self._store_url(image_url, analysis, response)
+            return analysis, None
+        return None, (data, digest, response)
 
-        colors = img.getcolors(10000)
-        if not colors:
-            return None
+    def _store_url(self, image_url, analysis, response):
+        if self.by_url:
+            self.by_url.store(
+                image_url, analysis,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+            )
 
-        max_count = 0
-        dominant = (0, 0, 0)
+    def analyze_many(self, image_urls, client):
+        """
+        Analyze several icons: downloads run concurrently and every image that
+        is not cached is analyzed in a single compute call. Returns {url: analysis
+        or None}; images that fail to decode are logged and map to None.
+        """
+        results = {}
+        pending = []
+        with self._lock:
+            for url in dict.fromkeys(image_urls):
+                if url in self._memo:
+                    results[url] = self._memo[url]
+                else:
+                    pending.append(url)
+        if not pending:
+            return results
 
-        for count, color in colors:
-            if len(color) == 4 and color[3] < 10:
-                continue
-            r, g, b = color[:3]
-            if r > 240 and g > 240 and b > 240:
-                continue
-            if r < 15 and g < 15 and b < 15:
-                continue
+        with ThreadPoolExecutor(max_workers=min(8, len(pending))) as pool:
+            fetched = list(pool.map(lambda u: self._fetch(u, client), pending))
+
+        to_compute = [(url, raw) for url, (_, raw) in zip(pending, fetched) if raw is not None]
+        computed = run_compute(_analyze_batch, [raw[0] for _, raw in to_compute]) if to_compute else []
+        computed = dict(zip((url for url, _ in to_compute), computed))
+
+        for url, (analysis, raw) in zip(pending, fetched):
+            if raw is not None:
+                analysis = computed[url]
+                if isinstance(analysis, Exception):
+                    logger.warning(f"Could not analyze image {url}: {analysis}")
+                    results[url] = None
+                    continue
+                data, digest, response = raw
+                if self._hash_root:
+                    write_json_atomic(self._content_path(digest), analysis)
+                self._store_url(url, analysis, response)
+            with self._lock:
+                self._memo[url] = analysis
+            results[url] = analysis
+        return results
+
+    def analyze(self, image_url, client):
+        return self.analyze_many([image_url], client).get(image_url)
 
-            if count > max_count:
-                max_count = count
-                dominant = color[:3]
+    def prune(self, max_age_days=30):
+        if not self.persistent:
+            return 0
+        return HttpCache(cache_path('icons')).prune(max_age_days=max_age_days)
 
-        return '#{:02x}{:02x}{:02x}'.format(*dominant).upper()
+_icon_cache = None
+_icon_cache_lock = threading.Lock()
+
+def get_icon_cache():
+    global _icon_cache
+    with _icon_cache_lock:
+        if _icon_cache is None:
+            _icon_cache = IconAnalysisCache()
+        return _icon_cache
+
+def extract_dominant_color(image_url, client):
+    if not image_url or not image_url.startswith(('http://', 'https://')):
+        return None
+
+    try:
+        analysis = get_icon_cache().analyze(image_url, client)
+        return analysis.get('dominant_color') if analysis else None
     except Exception as e:
         logger.warning(f"Could not extract color from {image_url}: {e}")
         return None
@@ -47,44 +246,150 @@ def get_image_quality(image_url, client):
         return 0, False, False
 
     try:
-        response = client.get(image_url, timeout=10)
-        if not response:
+        analysis = get_icon_cache().analyze(image_url, client)
+        if not analysis:
             return 0, False, False
+        return analysis['quality'], analysis['is_square'], analysis['has_transparency']
+    except Exception as e:
+        logger.warning(f"Could not analyze image {image_url}: {e}")
+        return 0, False, False
 
-        img = Image.open(BytesIO(response.content))
-        width, height = img.size
-
-        aspect_ratio = width / height
-        is_square = 0.95 <= aspect_ratio <= 1.05
-
-        has_transparency = False
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            img_rgba = img.convert("RGBA")
-            corners = [
-                (0, 0), (width-1, 0), (0, height-1), (width-1, height-1),
-                (width//2, 0), (0, height//2), (width-1, height//2), (width//2, height-1)
-            ]
-            for x, y in corners:
-                if img_rgba.getpixel((x, y))[3] < 250:
-                    has_transparency = True
+def _parse_image_header(data):
+    """
+    Dimensions and whether the image can carry alpha, from the first bytes of a
+    PNG, JPEG or WebP file. Returns None for other formats or truncated headers.
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 26 and data[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', data[16:24])
+        color_type = data[25]
+        if color_type in (4, 6):
+            may_have_alpha = True
+        elif color_type == 3:
+            # Palette images are only transparent with a tRNS chunk, which precedes IDAT.
+            may_have_alpha = True
+            pos = 8
+            while pos + 8 <= len(data):
+                length, chunk = struct.unpack('>I4s', data[pos:pos + 8])
+                if chunk == b'tRNS':
                     break
+                if chunk == b'IDAT':
+                    may_have_alpha = False
+                    break
+                pos += 12 + length
+        else:
+            may_have_alpha = False
+        return width, height, may_have_alpha
 
-        quality = 0
-        if is_square:
-            quality += 50
-        if not has_transparency:
-            quality += 50
+    if data[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 9 <= len(data):
+            if data[pos] != 0xFF:
+                return None
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return width, height, False
+            pos += 2 + length
+        return None
 
-        res_score = min(100, (width * height) / (1024 * 1024) * 100)
-        quality += res_score
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ' and data[23:26] == b'\x9d\x01\x2a':
+            width, height = struct.unpack('<HH', data[26:30])
+            return width & 0x3FFF, height & 0x3FFF, False
+        if chunk == b'VP8L' and data[20] == 0x2F:
+            bits = struct.unpack('<I', data[21:25])[0]
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, True
+        if chunk == b'VP8X':
+            flags = data[20]
+            width = 1 + int.from_bytes(data[24:27], 'little')
+            height = 1 + int.from_bytes(data[27:30], 'little')
+            return width, height, bool(flags & 0x10)
+    return None
 
-        if is_square and not has_transparency:
-            quality += 50
-            if width >= 512:
-                quality += 50
+def probe_image_header(image_url, client):
+    """Fetch only the first few KB of an image and parse its header (see _parse_image_header)."""
+    if not image_url or not image_url.startswith(('http://', 'https://')):
+        return None
+    response = client.get(image_url, timeout=10, stream=True, headers={'Range': f'bytes=0-{_PROBE_BYTES - 1}'})
+    if not response:
+        return None
+    try:
+        data = b''
+        for chunk in response.iter_content(chunk_size=_PROBE_BYTES):
+            data += chunk
+            if len(data) >= _PROBE_BYTES:
+                break
+    except Exception:
+        return None
+    finally:
+        response.close()
+    header = _parse_image_header(data)
+    if not header or header[0] <= 0 or header[1] <= 0:
+        return None
+    return header
 
-        return quality, is_square, has_transparency
-    except Exception as e:
-        logger.warning(f"Could not analyze image {image_url}: {e}")
-        return 0, False, False
+def select_best_icon(candidates, client, score_fn=None):
+    """
+    Same choice as scoring every candidate with get_image_quality (plus
+    score_fn) and keeping the first strictly best, without downloading them
+    all. Headers give an exact score for images that cannot be transparent and
+    an upper bound for the rest; those are fully analyzed best-bound first
+    until no remaining bound can beat the best score found.
+    Returns (best_url, best_score), or (None, -1) without candidates.
+    """
+    candidates = list(candidates or [])
+    if not candidates:
+        return None, -1
+    bonuses = [score_fn(c) if score_fn else 0 for c in candidates]
+
+    with ThreadPoolExecutor(max_workers=min(8, len(candidates))) as pool:
+        headers = list(pool.map(lambda c: _safe_probe(c, client), candidates))
+
+    scores = {}
+    bounds = []
+    for i, header in enumerate(headers):
+        if header is None:
+            bounds.append((float('inf'), i))
+            continue
+        width, height, may_have_alpha = header
+        quality = _quality_for(width, height, False)
+        if may_have_alpha:
+            bounds.append((quality + bonuses[i], i))
+        else:
+            scores[i] = quality + bonuses[i]
+
+    best = max(scores.values(), default=-1)
+    analyzed = 0
+    remaining = sorted(bounds, key=lambda b: (-b[0], b[1]))
+    batch_size = max(1, int(os.environ.get('ICON_ANALYZE_BATCH', '3')))
+    while remaining and remaining[0][0] >= best:
+        batch = [i for bound, i in remaining[:batch_size] if bound >= best]
+        remaining = remaining[len(batch):]
+        analyses = get_icon_cache().analyze_many([candidates[i] for i in batch], client)
+        analyzed += len(batch)
+        for i in batch:
+            analysis = analyses.get(candidates[i])
+            scores[i] = (analysis['quality'] if analysis else 0) + bonuses[i]
+            best = max(best, scores[i])
 
+    best_url, best_score = None, -1
+    for i, cand in enumerate(candidates):
+        if i in scores and scores[i] > best_score:
+            best_score = scores[i]
+            best_url = cand
+    logger.info(f"Icon selection downloaded {analyzed}/{len(candidates)} candidates in full")
+    return best_url, best_score
+
+def _safe_probe(image_url, client):
+    try:
+        return probe_image_header(image_url, client)
+    except Exception:
+        return None
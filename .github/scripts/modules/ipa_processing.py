@@ -1,11 +1,13 @@
+import contextlib
 import hashlib
 import os
 import plistlib
-import re
-import shutil
 import struct
 import tempfile
+import threading
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 from utils import logger
 
@@ -22,21 +24,27 @@ _EXCLUDED_ENTITLEMENTS = {
     'application-identifier',
 }
 
-def _find_macho_slice(data):
-    if len(data) < 4:
+def _read_at(f, offset, size):
+    f.seek(offset)
+    return f.read(size)
+
+def _find_macho_slice(f):
+    head = _read_at(f, 0, 8)
+    if len(head) < 4:
         return None
-    magic = struct.unpack_from('>I', data, 0)[0]
-    if magic in (_FAT_MAGIC, _FAT_MAGIC_64):
-        nfat = struct.unpack_from('>I', data, 4)[0]
+    magic = struct.unpack_from('>I', head, 0)[0]
+    if magic in (_FAT_MAGIC, _FAT_MAGIC_64) and len(head) >= 8:
+        nfat = struct.unpack_from('>I', head, 4)[0]
+        entry_size = 20 if magic == _FAT_MAGIC else 32
+        data = _read_at(f, 8, min(nfat, 64) * entry_size)
         best = None
-        for i in range(nfat):
+        for i in range(len(data) // entry_size):
+            base = i * entry_size
             if magic == _FAT_MAGIC:
-                base = 8 + i * 20
                 cpu_type = struct.unpack_from('>I', data, base)[0]
                 offset = struct.unpack_from('>I', data, base + 8)[0]
                 size = struct.unpack_from('>I', data, base + 12)[0]
             else:
-                base = 8 + i * 32
                 cpu_type = struct.unpack_from('>I', data, base)[0]
                 offset = struct.unpack_from('>Q', data, base + 8)[0]
                 size = struct.unpack_from('>Q', data, base + 16)[0]
@@ -45,9 +53,9 @@ def _find_macho_slice(data):
             if best is None:
                 best = (offset, size)
         return best
-    magic_le = struct.unpack_from('<I', data, 0)[0]
+    magic_le = struct.unpack_from('<I', head, 0)[0]
     if magic_le in (_MH_MAGIC_64, _MH_MAGIC_32) or magic in (_MH_MAGIC_64, _MH_MAGIC_32):
-        return (0, len(data))
+        return (0, None)
     return None
 
 def _parse_code_signature(cs_data):
@@ -78,39 +86,164 @@ def _parse_code_signature(cs_data):
                 pass
     return entitlements
 
-def _extract_entitlements_from_macho(data):
-    slice_info = _find_macho_slice(data)
+def _extract_entitlements_from_macho(f):
+    """
+    Read entitlements from a seekable Mach-O file object. Only the fat header,
+    the load commands and the code signature blob are read, never the whole binary.
+    """
+    slice_info = _find_macho_slice(f)
     if not slice_info:
         return set()
     offset, size = slice_info
-    macho = data[offset:offset + size]
-    if len(macho) < 32:
+    header = _read_at(f, offset, 32)
+    if len(header) < 32:
         return set()
-    magic = struct.unpack_from('<I', macho, 0)[0]
+    magic = struct.unpack_from('<I', header, 0)[0]
     if magic == _MH_MAGIC_64:
         header_size = 32
     elif magic == _MH_MAGIC_32:
         header_size = 28
     else:
         return set()
-    ncmds = struct.unpack_from('<I', macho, 16)[0]
-    pos = header_size
+    ncmds = struct.unpack_from('<I', header, 16)[0]
+    sizeofcmds = struct.unpack_from('<I', header, 20)[0]
+    if size is not None:
+        sizeofcmds = min(sizeofcmds, max(0, size - header_size))
+    commands = _read_at(f, offset + header_size, sizeofcmds)
+    pos = 0
     cs_offset = cs_size = None
     for _ in range(ncmds):
-        if pos + 8 > len(macho):
+        if pos + 8 > len(commands):
             break
-        cmd = struct.unpack_from('<I', macho, pos)[0]
-        cmdsize = struct.unpack_from('<I', macho, pos + 4)[0]
+        cmd = struct.unpack_from('<I', commands, pos)[0]
+        cmdsize = struct.unpack_from('<I', commands, pos + 4)[0]
         if cmd == _LC_CODE_SIGNATURE:
-            cs_offset = struct.unpack_from('<I', macho, pos + 8)[0]
-            cs_size = struct.unpack_from('<I', macho, pos + 12)[0]
+            if pos + 16 > len(commands):
+                break
+            cs_offset = struct.unpack_from('<I', commands, pos + 8)[0]
+            cs_size = struct.unpack_from('<I', commands, pos + 12)[0]
+            break
+        if cmdsize < 8:
             break
         pos += cmdsize
     if cs_offset is None:
         return set()
-    cs_data = macho[cs_offset:cs_offset + cs_size]
+    if size is not None:
+        cs_size = max(0, min(cs_size, size - cs_offset))
+    cs_data = _read_at(f, offset + cs_offset, cs_size)
     return _parse_code_signature(cs_data)
 
+def _archive_handle(ipa):
+    """
+    Handle for reading stored members directly: a fresh one per call for a path,
+    so concurrent extension scans never share a file position; the caller's own
+    file object (read sequentially) otherwise.
+    """
+    if isinstance(ipa, (str, os.PathLike)):
+        return open(ipa, 'rb')
+    return contextlib.nullcontext(ipa)
+
+def _open_member(zf, name, fp=None):
+    """
+    Seekable handle for a ZIP member. Stored members are read straight from fp
+    (a handle on the same archive) at the member's data offset, so seeking costs
+    nothing (and only the touched ranges are fetched for remote archives);
+    compressed members use ZipExtFile, which seeks by decompressing forward
+    without buffering the member.
+    """
+    info = zf.getinfo(name)
+    if info.compress_type == zipfile.ZIP_STORED and fp is not None:
+        header = _read_at(fp, info.header_offset, _LOCAL_HEADER.size)
+        if len(header) == _LOCAL_HEADER.size:
+            fields = _LOCAL_HEADER.unpack(header)
+            if fields[0] == b'PK\x03\x04':
+                data_offset = info.header_offset + _LOCAL_HEADER.size + fields[9] + fields[10]
+                return _StoredMember(fp, data_offset, info.file_size)
+    return zf.open(info)
+
+class _StoredMember:
+    """Window onto an uncompressed member inside a file object owned by the caller."""
+
+    def __init__(self, raw, data_offset, size):
+        self._raw = raw
+        self._start = data_offset
+        self._size = size
+        self._pos = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def read(self, size=-1):
+        remaining = max(0, self._size - self._pos)
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self._raw.seek(self._start + self._pos)
+        data = self._raw.read(size)
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _index_members(names):
+    """
+    One pass over the central directory: the first Payload/*.app bundle and the
+    .appex bundles under its PlugIns directory.
+    """
+    app_prefix = None
+    appexes = set()
+    for n in names:
+        if not n.startswith('Payload/'):
+            continue
+        slash = n.find('/', 8)
+        if slash < 0:
+            continue
+        if app_prefix is None:
+            bundle = n[8:slash]
+            if len(bundle) <= len('.app') or not bundle.endswith('.app'):
+                continue
+            app_prefix = n[:slash]
+        elif n[:slash] != app_prefix:
+            continue
+        if n.startswith('PlugIns/', slash + 1):
+            start = slash + 1 + len('PlugIns/')
+            end = n.find('/', start)
+            if end > start and n[start:end].endswith('.appex') and end - start > len('.appex'):
+                appexes.add(n[:end])
+    return app_prefix, sorted(appexes)
+
+def _collect_privacy(plist, privacy):
+    for key, value in plist.items():
+        if key.endswith('UsageDescription') and isinstance(value, str) and value.strip():
+            privacy[key] = value.strip()
+
+def _scan_extension(zf, names, appex, ipa):
+    entitlements = set()
+    privacy = {}
+    ext_info = f"{appex}/Info.plist"
+    ext_exec = appex.split('/')[-1].replace('.appex', '')
+    if ext_info in names:
+        with zf.open(ext_info) as f:
+            ext_plist = plistlib.load(f)
+        ext_exec = ext_plist.get('CFBundleExecutable', ext_exec)
+        _collect_privacy(ext_plist, privacy)
+    ext_exec_path = f"{appex}/{ext_exec}"
+    if ext_exec_path in names:
+        with _archive_handle(ipa) as fp, _open_member(zf, ext_exec_path, fp) as f:
+            entitlements = _extract_entitlements_from_macho(f)
+    return entitlements, privacy
+
 def parse_ipa(ipa_path, default_bundle_id):
     result = {
         'version': None, 'build': None,
@@ -123,14 +256,9 @@ def parse_ipa(ipa_path, default_bundle_id):
 
     try:
         with zipfile.ZipFile(ipa_path, 'r') as zf:
-            names = zf.namelist()
-
-            app_prefix = None
-            for n in names:
-                m = re.match(r'^Payload/([^/]+\.app)/', n)
-                if m:
-                    app_prefix = f"Payload/{m.group(1)}"
-                    break
+            names = set(zf.namelist())
+
+            app_prefix, appex_prefixes = _index_members(zf.namelist())
             if not app_prefix:
                 logger.warning("No .app bundle found in IPA")
                 return result
@@ -146,35 +274,23 @@ def parse_ipa(ipa_path, default_bundle_id):
                 result['bundle_id'] = plist.get('CFBundleIdentifier', default_bundle_id)
                 result['min_os_version'] = plist.get('MinimumOSVersion')
                 exec_name = plist.get('CFBundleExecutable', exec_name)
-                for key, value in plist.items():
-                    if key.endswith('UsageDescription') and isinstance(value, str) and value.strip():
-                        all_privacy[key] = value.strip()
+                _collect_privacy(plist, all_privacy)
 
             exec_path = f"{app_prefix}/{exec_name}"
             if exec_path in names:
-                with zf.open(exec_path) as f:
-                    all_entitlements |= _extract_entitlements_from_macho(f.read())
-
-            appex_prefixes = set()
-            for n in names:
-                em = re.match(rf'^{re.escape(app_prefix)}/PlugIns/([^/]+\.appex)/', n)
-                if em:
-                    appex_prefixes.add(f"{app_prefix}/PlugIns/{em.group(1)}")
-
-            for appex in sorted(appex_prefixes):
-                ext_info = f"{appex}/Info.plist"
-                ext_exec = appex.split('/')[-1].replace('.appex', '')
-                if ext_info in names:
-                    with zf.open(ext_info) as f:
-                        ext_plist = plistlib.load(f)
-                    ext_exec = ext_plist.get('CFBundleExecutable', ext_exec)
-                    for key, value in ext_plist.items():
-                        if key.endswith('UsageDescription') and isinstance(value, str) and value.strip():
-                            all_privacy[key] = value.strip()
-                ext_exec_path = f"{appex}/{ext_exec}"
-                if ext_exec_path in names:
-                    with zf.open(ext_exec_path) as f:
-                        all_entitlements |= _extract_entitlements_from_macho(f.read())
+                with _archive_handle(ipa_path) as fp, _open_member(zf, exec_path, fp) as f:
+                    all_entitlements |= _extract_entitlements_from_macho(f)
+
+            # Parallel scans need a handle each, which only a path can provide.
+            if len(appex_prefixes) > 1 and isinstance(ipa_path, (str, os.PathLike)):
+                workers = min(len(appex_prefixes), int(os.environ.get('APPEX_SCAN_WORKERS', '4')))
+                with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                    scanned = list(pool.map(lambda appex: _scan_extension(zf, names, appex, ipa_path), appex_prefixes))
+            else:
+                scanned = [_scan_extension(zf, names, appex, ipa_path) for appex in appex_prefixes]
+            for ext_entitlements, ext_privacy in scanned:
+                all_entitlements |= ext_entitlements
+                all_privacy.update(ext_privacy)
 
         result['permissions'] = {
             'entitlements': sorted(all_entitlements),
@@ -186,12 +302,45 @@ def parse_ipa(ipa_path, default_bundle_id):
 
     return result
 
+_SHA256_MEMO = {}
+_SHA256_LOCK = threading.Lock()
+
+def _file_identity(path):
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def remember_sha256(path, digest):
+    """Record a digest computed while the file was written, so later lookups skip re-reading it."""
+    try:
+        identity = _file_identity(path)
+    except OSError:
+        return
+    with _SHA256_LOCK:
+        _SHA256_MEMO[identity] = digest
+
+def known_sha256(path):
+    """The digest recorded for this exact file, if any, without reading it."""
+    try:
+        identity = _file_identity(path)
+    except OSError:
+        return None
+    with _SHA256_LOCK:
+        return _SHA256_MEMO.get(identity)
+
 def get_ipa_sha256(ipa_path):
+    identity = _file_identity(ipa_path)
+    with _SHA256_LOCK:
+        cached = _SHA256_MEMO.get(identity)
+    if cached:
+        return cached
+
     sha256_hash = hashlib.sha256()
     with open(ipa_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
+        for byte_block in iter(lambda: f.read(1024 * 1024), b""):
             sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+    digest = sha256_hash.hexdigest()
+    remember_sha256(ipa_path, digest)
+    return digest
 
 def package_app_to_ipa(app_path, output_ipa_path):
     try:
@@ -206,61 +355,161 @@ def package_app_to_ipa(app_path, output_ipa_path):
         logger.error(f"Failed to package IPA from {app_path}: {e}")
         return False
 
+_FIXED_TIME = (2020, 1, 1, 0, 0, 0)
+
+# Bump whenever repackage_ipa_with_bundle_id's output bytes change for the same input.
+REPACKAGER_VERSION = 3
+
+# ZIP record layouts (APPNOTE 4.3); only the public ZipInfo fields are read from zipfile.
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_ZIP64_END = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_END_RECORD = struct.Struct('<4s4H2LH')
+# Same threshold as zipfile: larger sizes/offsets go in ZIP64 extra fields.
+_ZIP64_LIMIT = (1 << 31) - 1
+_DOS_DATE = ((_FIXED_TIME[0] - 1980) << 9) | (_FIXED_TIME[1] << 5) | _FIXED_TIME[2]
+_DOS_TIME = (_FIXED_TIME[3] << 11) | (_FIXED_TIME[4] << 5) | (_FIXED_TIME[5] // 2)
+
+def _field32(value):
+    return 0xFFFFFFFF if value > _ZIP64_LIMIT else value
+
+class _RawZipWriter:
+    """
+    Minimal ZIP writer for repackaging: members are appended either as
+    already-compressed bytes copied from another archive or as deflated data,
+    all with a fixed timestamp, and the central directory (ZIP64 when needed)
+    is written on close.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.entries = []
+
+    def _name(self, name):
+        try:
+            return name.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return name.encode('utf-8'), 0x800
+
+    def _begin(self, name, method, crc, compress_size, file_size, external_attr):
+        name_bytes, flags = self._name(name)
+        offset = self.fp.tell()
+        zip64 = compress_size > _ZIP64_LIMIT or file_size > _ZIP64_LIMIT
+        extra = struct.pack('<2H2Q', 1, 16, file_size, compress_size) if zip64 else b''
+        self.fp.write(_LOCAL_HEADER.pack(
+            b'PK\x03\x04', 45 if zip64 else 20, flags, method, _DOS_TIME, _DOS_DATE, crc,
+            0xFFFFFFFF if zip64 else compress_size, 0xFFFFFFFF if zip64 else file_size,
+            len(name_bytes), len(extra),
+        ))
+        self.fp.write(name_bytes)
+        self.fp.write(extra)
+        self.entries.append((name_bytes, flags, method, crc, compress_size, file_size, external_attr, offset))
+
+    def copy_member(self, src_fp, info):
+        """Copy info's compressed bytes verbatim from src_fp, an open handle on the archive it came from."""
+        src_fp.seek(info.header_offset)
+        header = src_fp.read(_LOCAL_HEADER.size)
+        if len(header) != _LOCAL_HEADER.size:
+            raise zipfile.BadZipFile(f"Truncated local header for {info.filename}")
+        fields = _LOCAL_HEADER.unpack(header)
+        if fields[0] != b'PK\x03\x04':
+            raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+        src_fp.seek(info.header_offset + _LOCAL_HEADER.size + fields[9] + fields[10])
+
+        self._begin(info.filename, info.compress_type, info.CRC, info.compress_size, info.file_size, info.external_attr)
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = src_fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated data for {info.filename}")
+            self.fp.write(chunk)
+            remaining -= len(chunk)
+
+    def write_deflated(self, name, data, external_attr, level=6):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        self._begin(name, zipfile.ZIP_DEFLATED, zlib.crc32(data), len(payload), len(data), external_attr)
+        self.fp.write(payload)
+
+    def close(self):
+        cd_offset = self.fp.tell()
+        for name_bytes, flags, method, crc, compress_size, file_size, external_attr, offset in self.entries:
+            zip64_fields = [v for v in (file_size, compress_size, offset) if v > _ZIP64_LIMIT]
+            extra = struct.pack(f'<2H{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b''
+            version = 45 if zip64_fields else 20
+            self.fp.write(_CENTRAL_HEADER.pack(
+                b'PK\x01\x02', (3 << 8) | version, version, flags, method, _DOS_TIME, _DOS_DATE, crc,
+                _field32(compress_size), _field32(file_size),
+                len(name_bytes), len(extra), 0, 0, 0, external_attr, _field32(offset),
+            ))
+            self.fp.write(name_bytes)
+            self.fp.write(extra)
+        cd_end = self.fp.tell()
+        count, cd_size = len(self.entries), cd_end - cd_offset
+
+        if count >= 0xFFFF or cd_size > _ZIP64_LIMIT or cd_offset > _ZIP64_LIMIT:
+            self.fp.write(_ZIP64_END.pack(
+                b'PK\x06\x06', _ZIP64_END.size - 12, (3 << 8) | 45, 45, 0, 0, count, count, cd_size, cd_offset,
+            ))
+            self.fp.write(_ZIP64_LOCATOR.pack(b'PK\x06\x07', 0, cd_end, 1))
+        self.fp.write(_END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            _field32(cd_size), _field32(cd_offset), 0,
+        ))
+
 def repackage_ipa_with_bundle_id(ipa_path, new_bundle_id, output_path=None):
+    """
+    Rewrite CFBundleIdentifier without extracting the IPA: every other member's
+    compressed bytes are copied as-is and only Info.plist is re-encoded. Entries
+    are written in sorted order with a fixed timestamp so output is deterministic.
+    """
     if output_path is None:
         output_path = ipa_path
 
-    temp_dir = None
+    tmp_output = None
     try:
-        temp_dir = tempfile.mkdtemp(prefix='ipa_repackage_')
-
-        with zipfile.ZipFile(ipa_path, 'r') as ipa:
-            ipa.extractall(temp_dir)
-
-        payload_dir = os.path.join(temp_dir, 'Payload')
-        if not os.path.exists(payload_dir):
-            logger.error(f"No Payload directory found in {ipa_path}")
-            return False, None
-
-        app_dirs = [d for d in os.listdir(payload_dir) if d.endswith('.app')]
-        if not app_dirs:
-            logger.error(f"No .app directory found in {ipa_path}")
-            return False, None
-
-        app_dir = os.path.join(payload_dir, app_dirs[0])
-        info_plist_path = os.path.join(app_dir, 'Info.plist')
-
-        if not os.path.exists(info_plist_path):
-            logger.error(f"Info.plist not found in {app_dir}")
-            return False, None
-
-        with open(info_plist_path, 'rb') as f:
-            plist = plistlib.load(f)
-
-        old_bundle_id = plist.get('CFBundleIdentifier', '')
-        plist['CFBundleIdentifier'] = new_bundle_id
-
-        with open(info_plist_path, 'wb') as f:
-            plistlib.dump(plist, f)
-
-        logger.info(f"Modified bundle ID: {old_bundle_id} -> {new_bundle_id}")
-
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as ipa:
-            FIXED_TIME = (2020, 1, 1, 0, 0, 0)
-            all_files = []
-            for root, dirs, files in os.walk(temp_dir):
-                dirs.sort()
-                for file in sorted(files):
-                    full_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(full_path, temp_dir)
-                    all_files.append((relative_path, full_path))
-
-            for relative_path, full_path in sorted(all_files):
-                info = zipfile.ZipInfo(relative_path, date_time=FIXED_TIME)
-                info.compress_type = zipfile.ZIP_DEFLATED
-                with open(full_path, 'rb') as fh:
-                    ipa.writestr(info, fh.read())
-
+        with zipfile.ZipFile(ipa_path, 'r') as src:
+            members = {}
+            for info in src.infolist():
+                if not info.is_dir():
+                    members[info.filename] = info
+
+            plist_names = sorted(
+                n for n in members
+                if n.startswith('Payload/') and n.endswith('.app/Info.plist') and n.count('/') == 2
+            )
+            if not plist_names:
+                logger.error(f"Info.plist not found in {ipa_path}")
+                return False, None
+            info_plist_name = plist_names[0]
+
+            if any(info.flag_bits & 0x1 for info in members.values()):
+                logger.error(f"Encrypted ZIP members are not supported: {ipa_path}")
+                return False, None
+
+            plist = plistlib.loads(src.read(info_plist_name))
+            old_bundle_id = plist.get('CFBundleIdentifier', '')
+            plist['CFBundleIdentifier'] = new_bundle_id
+            plist_data = plistlib.dumps(plist)
+
+            logger.info(f"Modified bundle ID: {old_bundle_id} -> {new_bundle_id}")
+
+            # Write to a fresh file and swap it in: the input may be hard-linked into the download cache.
+            fd, tmp_output = tempfile.mkstemp(suffix='.ipa', dir=os.path.dirname(os.path.abspath(output_path)))
+            os.close(fd)
+            # Raw copies read through their own handle rather than the ZipFile's.
+            with open(ipa_path, 'rb') as src_fp, open(tmp_output, 'wb') as out_fp:
+                out = _RawZipWriter(out_fp)
+                for name in sorted(members):
+                    if name == info_plist_name:
+                        out.write_deflated(name, plist_data, members[name].external_attr)
+                    else:
+                        out.copy_member(src_fp, members[name])
+                out.close()
+
+        os.replace(tmp_output, output_path)
+        tmp_output = None
         sha256 = get_ipa_sha256(output_path)
 
         return True, sha256
@@ -269,6 +518,5 @@ def repackage_ipa_with_bundle_id(ipa_path, new_bundle_id, output_path=None):
         logger.error(f"Failed to repackage IPA {ipa_path}: {e}")
         return False, None
     finally:
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
-
+        if tmp_output and os.path.exists(tmp_output):
+            os.remove(tmp_output)
@@ -0,0 +1,224 @@
+import codecs
+import json
+import re
+
+_WS = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_DECODER = json.JSONDecoder()
+
+class _Reject(Exception):
+    pass
+
+class _ValueSkipper:
+    """Finds the end of one JSON value across chunks by tracking brackets and strings, without decoding it."""
+
+    __slots__ = ('pos', 'depth', 'in_string', 'escape')
+
+    def __init__(self, pos):
+        self.pos = pos
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def scan(self, buf):
+        """Returns the offset just past the value once it is complete, else None (more input needed)."""
+        i, n = self.pos, len(buf)
+        while i < n:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(buf, i)
+                if not m:
+                    i = n
+                    break
+                i = m.end()
+                if m.group() == '\\':
+                    self.escape = True
+                else:
+                    self.in_string = False
+                    if self.depth == 0:
+                        self.pos = i
+                        return i
+                continue
+            m = _STRUCTURAL.search(buf, i)
+            if not m:
+                i = n
+                break
+            c, j = m.group(), m.start()
+            if c == '"':
+                self.in_string = True
+                i = j + 1
+            elif c in '{[':
+                self.depth += 1
+                i = j + 1
+            elif c in '}]':
+                if self.depth == 0:
+                    # Closing bracket of the enclosing container ends a bare scalar.
+                    self.pos = j
+                    return j
+                self.depth -= 1
+                i = j + 1
+                if self.depth == 0:
+                    self.pos = i
+                    return i
+            else:
+                if self.depth == 0:
+                    self.pos = j
+                    return j
+                i = j + 1
+        self.pos = i
+        return None
+
+class _SourceScanner:
+    """
+    Incremental scanner for the AltStore source shape: a top-level object whose
+    "apps" member is a non-empty array starting with an object that has a
+    bundleIdentifier. Other top-level members are skipped unparsed, and apps
+    are decoded one element at a time.
+    """
+
+    def __init__(self, transform=None):
+        self.transform = transform
+        self.buf = ''
+        self.pos = 0
+        self.state = 'start'
+        self.skipper = None
+        self.apps = []
+        self.result = None
+
+    def feed(self, text):
+        """Consume more text; returns True once the document is accepted (result set)."""
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            if self.skipper is not None:
+                self.skipper.pos -= self.pos
+            self.pos = 0
+        self.buf += text
+        self._run()
+        return self.result is not None
+
+    def _run(self):
+        while self.result is None:
+            buf = self.buf
+            if self.state in ('skip', 'app'):
+                end = self.skipper.scan(buf)
+                if end is None:
+                    if self.state == 'skip':
+                        self.pos = self.skipper.pos
+                    return
+                if self.state == 'app':
+                    try:
+                        app, stop = _DECODER.raw_decode(buf, self.pos)
+                    except ValueError:
+                        raise _Reject()
+                    if buf[stop:end].strip():
+                        raise _Reject()
+                    self._add_app(app)
+                    self.state = 'after_app'
+                else:
+                    self.state = 'after_value'
+                self.pos = end
+                self.skipper = None
+                continue
+
+            i = _WS.match(buf, self.pos).end()
+            if i >= len(buf):
+                self.pos = i
+                return
+            c = buf[i]
+            state = self.state
+            if state == 'start':
+                if c != '{':
+                    raise _Reject()
+                self.pos, self.state = i + 1, 'key'
+            elif state == 'key':
+                if c != '"':
+                    raise _Reject()
+                m = _STRING.match(buf, i)
+                if not m:
+                    self.pos = i
+                    return
+                j = _WS.match(buf, m.end()).end()
+                if j >= len(buf):
+                    self.pos = i
+                    return
+                if buf[j] != ':':
+                    raise _Reject()
+                key = json.loads(m.group())
+                self.pos, self.state = j + 1, ('apps' if key == 'apps' else 'value')
+            elif state == 'value':
+                self.skipper = _ValueSkipper(i)
+                self.pos, self.state = i, 'skip'
+            elif state == 'after_value':
+                if c != ',':
+                    # End of the top-level object without an "apps" member.
+                    raise _Reject()
+                self.pos, self.state = i + 1, 'key'
+            elif state == 'apps':
+                if c != '[':
+                    raise _Reject()
+                self.pos, self.state = i + 1, 'app_start'
+            elif state == 'app_start':
+                if c == ']':
+                    self._finish()
+                    return
+                # Most entries arrive whole within the buffer and decode directly;
+                # otherwise find the end with the skipper first and decode once
+                try:
+                    app, stop = _DECODER.raw_decode(buf, i)
+                except ValueError:
+                    stop = None
+                # (a bare number at the end of the buffer may still be incomplete)
+                if stop is not None and isinstance(app, (dict, list)):
+                    self._add_app(app)
+                    self.pos, self.state = stop, 'after_app'
+                    continue
+                self.skipper = _ValueSkipper(i)
+                self.pos, self.state = i, 'app'
+            elif state == 'after_app':
+                if c == ']':
+                    self._finish()
+                    return
+                if c != ',':
+                    raise _Reject()
+                self.pos, self.state = i + 1, 'app_start'
+
+    def _add_app(self, app):
+        if not self.apps and not (isinstance(app, dict) and 'bundleIdentifier' in app):
+            raise _Reject()
+        if isinstance(app, dict):
+            self.apps.append(self.transform(app) if self.transform else app)
+
+    def _finish(self):
+        if not self.apps:
+            raise _Reject()
+        self.result = {'apps': self.apps}
+
+def probe_altstore_source(chunks, transform=None, max_bytes=0):
+    """
+    Validate a candidate AltStore source while it downloads.
+
+    chunks is an iterable of bytes (e.g. resp.iter_content()). Reading stops as
+    soon as the document is rejected, or once the apps array has closed.
+    Returns {'apps': [...]} with each app passed through transform, or None if
+    the data is not an AltStore source, is malformed, ends early or exceeds
+    max_bytes.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    scanner = _SourceScanner(transform)
+    read = 0
+    try:
+        for chunk in chunks:
+            read += len(chunk)
+            if max_bytes and read > max_bytes:
+                return None
+            if scanner.feed(decoder.decode(chunk)):
+                return scanner.result
+        scanner.feed(decoder.decode(b'', final=True))
+    except _Reject:
+        return None
+    return scanner.result
@@ -5,12 +5,10 @@ from utils import logger
 def get_readme_description(repo, client, max_length=500):
     import base64
     try:
-        url = f"https://api.github.com/repos/{repo}/readme"
-        resp = client.get(url)
-        if not resp:
+        data = client.get_readme(repo)
+        if not data:
             return None
 
-        data = resp.json()
         content_b64 = data.get('content', '')
         if not content_b64:
             return None
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+import time
+
+from modules.cache_store import cache_path, read_json, write_json_atomic
+
+# Only the fields find_official_source reads are kept from a discovered source.
+_APP_FIELDS = ('bundleIdentifier', 'screenshotURLs', 'screenshots', 'category',
+               'subtitle', 'tintColor', 'localizedDescription')
+
+def compact_app(app):
+    """Reduce an AltStore source app entry to the fields used for matching and supplementing."""
+    return {k: app[k] for k in _APP_FIELDS if k in app}
+
+class OfficialSourceCache:
+    """
+    Official-source discovery results per repo, shared by every variant and
+    source file. Positive entries keep each source URL with its validators and
+    compacted contents so it can be revalidated with a conditional request;
+    negative entries remember that nothing was found until their TTL expires.
+    Misses for a single bundle ID in a repo that does have sources are kept
+    under the same TTL, so a bundle ID that matches nothing doesn't trigger a
+    full rediscovery on every call.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or cache_path('official-sources')
+        self.negative_ttl = float(os.environ.get('OFFICIAL_SOURCE_NEGATIVE_TTL_HOURS', '24')) * 3600
+        self.rediscover_after = float(os.environ.get('OFFICIAL_SOURCE_REDISCOVER_HOURS', '168')) * 3600
+        self.enabled = os.environ.get('OFFICIAL_SOURCE_CACHE', '1') != '0'
+        self._memo = {}
+        self._misses = set()
+        self._lock = threading.Lock()
+
+    def _path(self, repo):
+        digest = hashlib.sha256(repo.lower().encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def _miss_path(self, repo, bundle_id):
+        digest = hashlib.sha256(f"{repo.lower()}\n{bundle_id}".encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'misses', digest[:2], f"{digest}.json")
+
+    def has_recent_miss(self, repo, bundle_id):
+        with self._lock:
+            if (repo.lower(), bundle_id) in self._misses:
+                return True
+        if not self.enabled:
+            return False
+        entry = read_json(self._miss_path(repo, bundle_id))
+        if not isinstance(entry, dict) or entry.get('repo', '').lower() != repo.lower() or entry.get('bundle_id') != bundle_id:
+            return False
+        return time.time() - entry.get('missed_at', 0) < self.negative_ttl
+
+    def record_miss(self, repo, bundle_id):
+        with self._lock:
+            self._misses.add((repo.lower(), bundle_id))
+        if self.enabled:
+            write_json_atomic(self._miss_path(repo, bundle_id),
+                              {'repo': repo, 'bundle_id': bundle_id, 'missed_at': time.time()})
+
+    def memo_get(self, repo):
+        with self._lock:
+            return self._memo.get(repo.lower())
+
+    def memo_set(self, repo, sources):
+        with self._lock:
+            self._memo[repo.lower()] = sources
+
+    def load(self, repo):
+        """Returns (entry, is_fresh). Fresh negative entries need no requests; fresh positive ones only revalidation."""
+        entry = read_json(self._path(repo))
+        if not isinstance(entry, dict) or entry.get('repo', '').lower() != repo.lower():
+            return None, False
+        age = time.time() - entry.get('discovered_at', 0)
+        ttl = self.rediscover_after if entry.get('sources') else self.negative_ttl
+        return entry, age < ttl
+
+    def store(self, repo, sources, discovered_at=None, complete=True):
+        entry = {
+            'repo': repo,
+            'discovered_at': discovered_at or time.time(),
+            'complete': complete,
+            'sources': sources,
+        }
+        return write_json_atomic(self._path(repo), entry)
+
+    def prune(self, max_age_days=30):
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
@@ -0,0 +1,139 @@
+import base64
+import json
+import os
+
+from utils import logger, RELEASE_PAGE_SIZE
+
+ASSETS_PER_RELEASE = 100
+
+# digest ("sha256:..." or null for assets uploaded before GitHub computed it)
+# lets release candidates skip the per-asset REST lookup before a remote read.
+_RELEASE_FIELDS = f"""
+    databaseId tagName name description isDraft isPrerelease publishedAt createdAt url
+    releaseAssets(first: {ASSETS_PER_RELEASE}) {{
+      totalCount
+      nodes {{ databaseId name size digest downloadUrl contentType createdAt updatedAt }}
+    }}
+"""
+
+_README_PATHS = ('README.md', 'readme.md', 'Readme.md', 'README')
+
+def _repo_fragment(alias, repo):
+    owner, name = repo.split('/', 1)
+    readmes = '\n'.join(
+        f'readme{i}: object(expression: {json.dumps("HEAD:" + p)}) {{ ... on Blob {{ text isBinary }} }}'
+        for i, p in enumerate(_README_PATHS)
+    )
+    return f"""
+  {alias}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{
+    nameWithOwner
+    description
+    owner {{ login avatarUrl }}
+    defaultBranchRef {{ name }}
+    latestRelease {{ {_RELEASE_FIELDS} }}
+    releases(first: {RELEASE_PAGE_SIZE}, orderBy: {{field: CREATED_AT, direction: DESC}}) {{
+      nodes {{ {_RELEASE_FIELDS} }}
+    }}
+    {readmes}
+  }}"""
+
+def _rest_release(node):
+    """Reshape a GraphQL Release node into the REST release payload the pipeline reads."""
+    if not node:
+        return None
+    assets = [
+        {
+            'id': a.get('databaseId'),
+            'name': a.get('name'),
+            'size': a.get('size'),
+            'browser_download_url': a.get('downloadUrl'),
+            'content_type': a.get('contentType'),
+            'digest': a.get('digest'),
+            'created_at': a.get('createdAt'),
+            'updated_at': a.get('updatedAt'),
+        }
+        for a in ((node.get('releaseAssets') or {}).get('nodes') or [])
+    ]
+    return {
+        'id': node.get('databaseId'),
+        'tag_name': node.get('tagName'),
+        'name': node.get('name'),
+        'body': node.get('description'),
+        'draft': node.get('isDraft', False),
+        'prerelease': node.get('isPrerelease', False),
+        'published_at': node.get('publishedAt'),
+        'created_at': node.get('createdAt'),
+        'html_url': node.get('url'),
+        'assets': assets,
+    }
+
+def _assets_complete(node):
+    assets = node.get('releaseAssets') or {}
+    return (assets.get('totalCount') or 0) <= len(assets.get('nodes') or [])
+
+def _seed_repo(client, repo, data):
+    api = f"https://api.github.com/repos/{repo}"
+    seeded = client._json_cache
+
+    # Empty repos have no defaultBranchRef; leave their info to the REST call.
+    branch = (data.get('defaultBranchRef') or {}).get('name')
+    if branch:
+        seeded[api] = {
+            'full_name': data.get('nameWithOwner') or repo,
+            'description': data.get('description'),
+            'default_branch': branch,
+            'owner': {
+                'login': (data.get('owner') or {}).get('login'),
+                'avatar_url': (data.get('owner') or {}).get('avatarUrl'),
+            },
+        }
+
+    latest = data.get('latestRelease')
+    if latest is None or _assets_complete(latest):
+        seeded[f"{api}/releases/latest"] = _rest_release(latest)
+
+    nodes = (data.get('releases') or {}).get('nodes') or []
+    if all(_assets_complete(n) for n in nodes):
+        seeded[f"{api}/releases?per_page={RELEASE_PAGE_SIZE}"] = [_rest_release(n) for n in nodes]
+
+    for i in range(len(_README_PATHS)):
+        blob = data.get(f'readme{i}')
+        if blob and not blob.get('isBinary') and blob.get('text'):
+            content = base64.b64encode(blob['text'].encode('utf-8')).decode('ascii')
+            seeded[f"{api}/readme"] = {'content': content, 'encoding': 'base64'}
+            break
+
+def _prefetch_batch(client, repos):
+    query = "query {" + ''.join(_repo_fragment(f"r{i}", r) for i, r in enumerate(repos)) + "\n}"
+    result = client.graphql(query)
+    if result is None:
+        if len(repos) > 10:
+            mid = len(repos) // 2
+            return _prefetch_batch(client, repos[:mid]) + _prefetch_batch(client, repos[mid:])
+        return 0
+
+    seeded = 0
+    data = result.get('data') or {}
+    for i, repo in enumerate(repos):
+        node = data.get(f"r{i}")
+        if node:
+            _seed_repo(client, repo, node)
+            seeded += 1
+    return seeded
+
+def prefetch_repo_metadata(client, repos):
+    """
+    Resolve repo info, latest releases and README for every repo with a handful
+    of aliased GraphQL queries and seed the client's JSON cache with REST-shaped
+    payloads. Anything missing or incomplete falls through to the REST calls.
+    """
+    if not client.token or os.environ.get('GRAPHQL_PREFETCH', '1') == '0':
+        return 0
+    repos = sorted({r for r in repos if r and '/' in r})
+    batch_size = max(1, int(os.environ.get('GRAPHQL_PREFETCH_BATCH', '50')))
+
+    seeded = 0
+    for start in range(0, len(repos), batch_size):
+        seeded += _prefetch_batch(client, repos[start:start + batch_size])
+    logger.info(f"GraphQL prefetch seeded metadata for {seeded}/{len(repos)} repos")
+    return seeded
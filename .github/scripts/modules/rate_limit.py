@@ -0,0 +1,215 @@
+import logging
+import math
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# (refill rate per second, burst, max in-flight) per host class. The API budget
+# stays under GitHub's secondary limit of 900 REST points per minute, and the
+# uploads budget stays under ~80 content-creating requests per minute. GraphQL
+# has its own hourly point budget, so its headers never pace REST traffic.
+DEFAULT_BUDGETS = {
+    'api': (15.0, 30, 20),
+    'graphql': (2.0, 5, 4),
+    'uploads': (1.3, 5, 4),
+    'cdn': (50.0, 100, 64),
+}
+
+_MUTATING_METHODS = {'POST', 'PATCH', 'PUT', 'DELETE'}
+
+# X-RateLimit-Resource values that map onto a budget other than the URL's host class.
+_RESOURCE_BUDGETS = {'core': 'api', 'graphql': 'graphql'}
+
+def host_class(url):
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host == 'api.github.com':
+        return 'graphql' if parsed.path.rstrip('/') == '/graphql' else 'api'
+    if host == 'uploads.github.com':
+        return 'uploads'
+    return 'cdn'
+
+class _HostBudget:
+    __slots__ = ('name', 'base_rate', 'rate', 'burst', 'tokens', 'updated', 'blocked_until', 'remaining',
+                 'reset_at', 'max_in_flight', 'limit', 'in_flight', 'logged_reset')
+
+    def __init__(self, name, rate, burst, max_in_flight):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.remaining = None
+        self.reset_at = None
+        self.max_in_flight = max_in_flight
+        self.limit = max_in_flight
+        self.in_flight = 0
+        self.logged_reset = None
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def scale(self, fraction):
+        """Run at fraction (0..1] of the configured rate and concurrency."""
+        self.rate = self.base_rate * fraction
+        if fraction < 1.0:
+            # Don't let a full bucket spend the reserve in one burst.
+            self.tokens = min(self.tokens, max(1.0, self.burst * fraction))
+        self.limit = max(1, min(self.max_in_flight, math.ceil(self.max_in_flight * fraction)))
+
+class RateLimitScheduler:
+    """
+    Token-bucket pacing per host class (api.github.com REST and GraphQL,
+    uploads.github.com, CDN), fed by the X-RateLimit-* and Retry-After headers
+    of every response. Once the remaining budget drops to the reserve, the rate
+    and concurrency shrink so that what is left lasts until the window resets.
+    """
+
+    def __init__(self, budgets=None, reserve=None, max_pause=None):
+        budgets = budgets or DEFAULT_BUDGETS
+        self._budgets = {k: _HostBudget(k, *v) for k, v in budgets.items()}
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self.reserve = reserve if reserve is not None else int(os.environ.get('RATE_LIMIT_RESERVE', '50'))
+        self.max_pause = max_pause if max_pause is not None else float(os.environ.get('RATE_LIMIT_MAX_PAUSE', '300'))
+
+    def _budget(self, url):
+        return self._budgets.get(host_class(url)) or self._budgets['cdn']
+
+    def _response_budget(self, response):
+        resource = _RESOURCE_BUDGETS.get((response.headers.get('X-RateLimit-Resource') or '').lower())
+        if resource and resource in self._budgets:
+            return self._budgets[resource]
+        return self._budget(response.url or '')
+
+    def acquire(self, method, url):
+        budget = self._budget(url)
+        cost = 5 if method in _MUTATING_METHODS and budget.name == 'api' else 1
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                budget.refill(now)
+                wait = budget.blocked_until - now
+                if wait <= 0 and budget.tokens >= cost:
+                    budget.tokens -= cost
+                    break
+                wait = max(wait, (cost - budget.tokens) / budget.rate)
+            time.sleep(min(wait, self.max_pause))
+        with self._slot_freed:
+            while budget.in_flight >= budget.limit:
+                self._slot_freed.wait()
+            budget.in_flight += 1
+        return budget
+
+    def release(self, budget):
+        with self._slot_freed:
+            budget.in_flight -= 1
+            self._slot_freed.notify_all()
+
+    def _throttle(self, budget, now):
+        """Spread the requests left above zero over the time until the window resets."""
+        if budget.remaining is None or budget.remaining > self.reserve or not budget.reset_at:
+            budget.scale(1.0)
+            return
+        seconds = budget.reset_at - now
+        if seconds <= 0 or budget.remaining == 0:
+            budget.scale(1.0)
+            return
+        fraction = min(1.0, (budget.remaining / seconds) / budget.base_rate)
+        budget.scale(fraction)
+        if budget.logged_reset != budget.reset_at:
+            budget.logged_reset = budget.reset_at
+            logger.warning(
+                f"Rate limit for {budget.name}: {budget.remaining} requests left, resets in {int(seconds)}s; "
+                f"slowing to {budget.rate * 60:.1f}/min with {budget.limit} in flight"
+            )
+
+    def observe(self, response):
+        """Record rate-limit headers. Returns the pause (seconds) imposed on the host, if any."""
+        if response is None:
+            return 0
+        headers = response.headers
+        budget = self._response_budget(response)
+        pause = 0.0
+
+        retry_after = headers.get('Retry-After')
+        if retry_after and response.status_code in (403, 429):
+            pause = _parse_retry_after(retry_after)
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        with self._lock:
+            now = time.time()
+            if remaining is not None and remaining.isdigit():
+                budget.remaining = int(remaining)
+                if reset and reset.isdigit():
+                    budget.reset_at = int(reset)
+                self._throttle(budget, now)
+                self._slot_freed.notify_all()
+            if response.status_code in (403, 429) and not pause and budget.remaining == 0 and budget.reset_at:
+                pause = budget.reset_at - now + 1
+
+            if pause <= 0:
+                return 0
+            if pause > self.max_pause:
+                if budget.logged_reset != ('exhausted', budget.reset_at):
+                    budget.logged_reset = ('exhausted', budget.reset_at)
+                    logger.warning(f"Rate limit for {budget.name} resets in {int(pause)}s; not waiting")
+                return 0
+            budget.blocked_until = max(budget.blocked_until, time.monotonic() + pause)
+        logger.warning(f"Rate limit reached for {budget.name}, pausing {int(pause)}s")
+        return pause
+
+    def api_remaining(self):
+        return self._budgets['api'].remaining
+
+    def recommended_workers(self, floor=2, ceiling=16, per_worker_budget=150):
+        """Size the app worker pool from the remaining core API budget."""
+        remaining = self.api_remaining()
+        if remaining is None:
+            return floor
+        return max(floor, min(ceiling, remaining // per_worker_budget))
+
+def _parse_retry_after(value):
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except Exception:
+        return 0.0
+
+class ScheduledAdapter(HTTPAdapter):
+    """HTTPAdapter that routes every request through a RateLimitScheduler."""
+
+    def __init__(self, scheduler, **kwargs):
+        self.scheduler = scheduler
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        budget = self.scheduler.acquire(request.method, request.url)
+        try:
+            resp = super().send(request, **kwargs)
+        finally:
+            self.scheduler.release(budget)
+
+        pause = self.scheduler.observe(resp)
+        if pause and resp.status_code in (403, 429) and request.method in ('GET', 'HEAD'):
+            resp.close()
+            budget = self.scheduler.acquire(request.method, request.url)
+            try:
+                resp = super().send(request, **kwargs)
+            finally:
+                self.scheduler.release(budget)
+            self.scheduler.observe(resp)
+        return resp
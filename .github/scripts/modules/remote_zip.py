@@ -0,0 +1,136 @@
+import io
+import os
+
+from utils import logger
+from modules.ipa_processing import parse_ipa
+
+_BLOCK_SIZE = 128 * 1024
+_TAIL_PREFETCH = 512 * 1024
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    Read-only, seekable view of a remote file backed by HTTP Range requests.
+    Fetched blocks are kept, and contiguous missing blocks are coalesced into a
+    single request, so zipfile can walk the central directory and open
+    individual members without downloading the whole archive.
+    """
+
+    def __init__(self, client, url, timeout=30):
+        super().__init__()
+        self.client = client
+        self.timeout = timeout
+        head = client.head(url, allow_redirects=True, timeout=timeout)
+        if head is None or head.status_code >= 400:
+            raise OSError(f"HEAD failed for {url}")
+        if head.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            raise OSError(f"Server does not support range requests: {url}")
+        self.url = head.url or url
+        self.size = int(head.headers.get('Content-Length') or 0)
+        if self.size <= 0:
+            raise OSError(f"Unknown content length for {url}")
+        self.bytes_fetched = 0
+        self.requests = 0
+        self.failed = False
+        self._blocks = {}
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise OSError("Negative seek position")
+        self._pos = pos
+        return self._pos
+
+    def _fetch(self, first_block, last_block):
+        start = first_block * _BLOCK_SIZE
+        end = min(self.size, (last_block + 1) * _BLOCK_SIZE) - 1
+        headers = self.client.headers.copy()
+        headers.pop('Authorization', None)
+        headers['Range'] = f"bytes={start}-{end}"
+        try:
+            resp = self.client.session.get(self.url, headers=headers, timeout=self.timeout)
+            if resp.status_code != 206:
+                raise OSError(f"Range request returned HTTP {resp.status_code}")
+            data = resp.content
+            if len(data) != end - start + 1:
+                raise OSError("Short range response")
+        except Exception:
+            self.failed = True
+            raise
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        for b in range(first_block, last_block + 1):
+            off = (b - first_block) * _BLOCK_SIZE
+            self._blocks[b] = data[off:off + _BLOCK_SIZE]
+
+    def _ensure(self, start, end):
+        first, last = start // _BLOCK_SIZE, (end - 1) // _BLOCK_SIZE
+        if start >= self.size - _BLOCK_SIZE and not self._blocks:
+            # zipfile starts at the end record and reads the central directory right
+            # after; pull a generous tail in one go.
+            first = min(first, max(0, (self.size - _TAIL_PREFETCH) // _BLOCK_SIZE))
+        run_start = None
+        for b in range(first, last + 2):
+            missing = b <= last and b not in self._blocks
+            if missing and run_start is None:
+                run_start = b
+            elif not missing and run_start is not None:
+                self._fetch(run_start, b - 1)
+                run_start = None
+
+    def readinto(self, buffer):
+        if self._pos >= self.size:
+            return 0
+        n = min(len(buffer), self.size - self._pos)
+        self._ensure(self._pos, self._pos + n)
+        view = memoryview(buffer)
+        written = 0
+        while written < n:
+            block, off = divmod(self._pos + written, _BLOCK_SIZE)
+            chunk = self._blocks[block][off:off + n - written]
+            view[written:written + len(chunk)] = chunk
+            written += len(chunk)
+        self._pos += written
+        return written
+
+def read_remote_ipa_info(client, url, default_bundle_id):
+    """
+    parse_ipa over HTTP Range requests: only the ZIP end record, the central
+    directory and the members parse_ipa opens are transferred. Returns None if
+    the server cannot serve ranges.
+    """
+    if os.environ.get('REMOTE_IPA_METADATA', '1') == '0':
+        return None
+    try:
+        remote = HttpRangeFile(client, url)
+    except Exception as e:
+        logger.info(f"Remote IPA metadata unavailable for {url}: {e}")
+        return None
+
+    with io.BufferedReader(remote, buffer_size=64 * 1024) as fp:
+        info = parse_ipa(fp, default_bundle_id)
+    if remote.failed:
+        # parse_ipa swallows errors; a partial read must not pass for complete metadata.
+        logger.warning(f"Range reads failed while parsing {url}, falling back to download")
+        return None
+    logger.info(
+        f"Read IPA metadata from {remote.bytes_fetched / 1024:.0f} KB of "
+        f"{remote.size / (1024 * 1024):.1f} MB in {remote.requests} range requests"
+    )
+    return info
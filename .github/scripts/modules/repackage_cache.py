@@ -0,0 +1,74 @@
+import hashlib
+import os
+import time
+
+from modules.cache_store import cache_path, read_json, write_json_atomic
+from modules.ipa_processing import REPACKAGER_VERSION
+
+class RepackageCache:
+    """
+    Maps (input IPA sha256, target bundle ID, repackager version) to the
+    repackaged output already published in a builds-* release. Repackaging is
+    deterministic, so a hit means the uploaded asset is byte-identical to what
+    a fresh rewrite would produce.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or cache_path('repackaged')
+
+    def _entry_path(self, input_sha256, bundle_id):
+        key = f"{REPACKAGER_VERSION}:{input_sha256}:{bundle_id}"
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def get(self, input_sha256, bundle_id):
+        if not input_sha256 or not bundle_id:
+            return None
+        path = self._entry_path(input_sha256, bundle_id)
+        entry = read_json(path)
+        if not isinstance(entry, dict) or entry.get('input_sha256') != input_sha256 \
+                or entry.get('bundle_id') != bundle_id or not entry.get('download_url'):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, input_sha256, bundle_id, sha256, size, download_url, asset_name=None):
+        if not input_sha256 or not bundle_id or not sha256 or not download_url:
+            return False
+        entry = {
+            'input_sha256': input_sha256,
+            'bundle_id': bundle_id,
+            'repackager_version': REPACKAGER_VERSION,
+            'sha256': sha256,
+            'size': size,
+            'download_url': download_url,
+            'asset_name': asset_name,
+        }
+        return write_json_atomic(self._entry_path(input_sha256, bundle_id), entry)
+
+    def prune(self, max_age_days=30):
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+_cache = None
+
+def get_repackage_cache():
+    global _cache
+    if os.environ.get('REPACKAGE_CACHE', '1') == '0':
+        return None
+    if _cache is None:
+        _cache = RepackageCache()
+    return _cache
@@ -2,9 +2,11 @@ import copy
 import json
 import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 from urllib.parse import urlparse, unquote
 
 from utils import logger, save_json, GLOBAL_CONFIG
+from modules.asset_rules import get_asset_rules
 
 def _get_skip_versions():
     return [x.lower() for x in GLOBAL_CONFIG.get('skip_versions', [])]
@@ -89,26 +91,17 @@ def deduplicate_versions(versions, app_name):
 def _is_allowed_version_url(url):
     if not url or not isinstance(url, str):
         return False
+    return _is_allowed_filename_url(url)
+
+@lru_cache(maxsize=16384)
+def _is_allowed_filename_url(url):
+    # The same version URLs appear in every source file, so results are cached per URL.
     parsed = urlparse(url)
     filename = (parsed.path or '').rsplit('/', 1)[-1]
     if not filename:
         return False
     lower_name = unquote(filename.lower())
-    scoring_cfg = (GLOBAL_CONFIG or {}).get('release_asset_scoring', {}) or {}
-    allowed_direct_exts = tuple(scoring_cfg.get('allowed_direct_extensions', ['.ipa']))
-    allowed_archive_exts = tuple(scoring_cfg.get('allowed_archive_extensions', ['.ipa.zip', '.zip', '.tar', '.tar.gz', '.tgz']))
-    archive_hint_tokens = tuple(scoring_cfg.get('archive_hint_tokens', ['ipa', 'ios', 'iphone', 'ipad']))
-    exclude_exts = tuple(scoring_cfg.get('exclude_extensions', []))
-    exclude_tokens = tuple(scoring_cfg.get('exclude_tokens', []))
-    if exclude_exts and lower_name.endswith(exclude_exts):
-        return False
-    if allowed_direct_exts and lower_name.endswith(allowed_direct_exts):
-        return True
-    if exclude_tokens and any(t in lower_name for t in exclude_tokens):
-        return False
-    if allowed_archive_exts and lower_name.endswith(allowed_archive_exts):
-        return any(t in lower_name for t in archive_hint_tokens)
-    return False
+    return get_asset_rules().is_allowed_filename(lower_name)
 
 def sync_and_save_apps_config(config_file, apps, original_apps):
     order_keys = ["name", "github_repo", "artifact_name", "github_workflow", "bundle_id", "icon_url", "pre_release", "tag_regex"]
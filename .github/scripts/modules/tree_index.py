@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import deque
+
+from modules.cache_store import cache_path, read_json, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on extra subtree requests when GitHub truncates a recursive tree.
+_SUBTREE_FETCH_LIMIT = int(os.environ.get('TREE_SUBTREE_FETCH_LIMIT', '50'))
+
+def _extension(path):
+    name = path[path.rfind('/') + 1:]
+    dot = name.rfind('.')
+    return name[dot:].lower() if dot >= 0 else ''
+
+class TreeIndex:
+    """
+    Compact, columnar view of a repository tree: parallel path / size / kind
+    columns plus per-extension buckets of row numbers, so scans for icons or
+    source JSON only touch matching entries.
+    """
+
+    __slots__ = ('sha', 'truncated', 'paths', 'sizes', 'blobs', 'by_ext')
+
+    def __init__(self, sha=None, truncated=False):
+        self.sha = sha
+        self.truncated = truncated
+        self.paths = []
+        self.sizes = array('q')
+        self.blobs = bytearray()
+        self.by_ext = {}
+
+    def add(self, path, is_blob, size=None):
+        row = len(self.paths)
+        self.paths.append(path)
+        self.sizes.append(-1 if size is None else size)
+        self.blobs.append(1 if is_blob else 0)
+        self.by_ext.setdefault(_extension(path), array('I')).append(row)
+
+    @classmethod
+    def from_entries(cls, entries, sha=None, truncated=False, prefix=''):
+        index = cls(sha, truncated)
+        index.extend(entries, prefix)
+        return index
+
+    def extend(self, entries, prefix=''):
+        for item in entries:
+            path = item.get('path')
+            if path:
+                self.add(prefix + path, item.get('type') == 'blob', item.get('size'))
+
+    def entries(self, extensions, blobs_only=False):
+        """Yield (path, size) for entries with one of the given extensions, in tree order."""
+        rows = []
+        for ext in extensions:
+            rows.extend(self.by_ext.get(ext.lower(), ()))
+        for row in sorted(rows):
+            if blobs_only and not self.blobs[row]:
+                continue
+            size = self.sizes[row]
+            yield self.paths[row], (None if size < 0 else size)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def to_json(self):
+        return {
+            'sha': self.sha,
+            'truncated': self.truncated,
+            'paths': self.paths,
+            'sizes': self.sizes.tolist(),
+            'blobs': self.blobs.hex(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls(data.get('sha'), data.get('truncated', False))
+        blobs = bytes.fromhex(data.get('blobs', ''))
+        for path, size, is_blob in zip(data.get('paths', []), data.get('sizes', []), blobs):
+            index.add(path, is_blob, None if size < 0 else size)
+        return index
+
+def _tree_url(repo, sha, recursive):
+    return f"https://api.github.com/repos/{repo}/git/trees/{sha}" + ("?recursive=1" if recursive else "")
+
+def _fetch_tree(client, repo, sha, recursive):
+    # Trees are immutable per SHA, so they bypass the JSON/ETag caches (and their memory).
+    resp = client.get(_tree_url(repo, sha, recursive), suppress_not_found_log=True, timeout=60)
+    if not resp:
+        return None
+    try:
+        return resp.json()
+    except Exception:
+        return None
+
+def _fetch_full_tree(client, repo, commit_sha):
+    # The trees endpoint accepts the commit SHA and reports the root tree SHA.
+    data = _fetch_tree(client, repo, commit_sha, recursive=True)
+    if not data or 'tree' not in data:
+        return None
+    tree_sha = data.get('sha') or commit_sha
+    if not data.get('truncated'):
+        return TreeIndex.from_entries(data['tree'], sha=tree_sha)
+
+    # The recursive listing was cut off: walk the tree level by level instead,
+    # asking for each subtree recursively and descending further only where
+    # that listing is truncated as well.
+    logger.info(f"Git tree for {repo} is truncated, fetching subtrees")
+    index = TreeIndex(sha=tree_sha)
+    pending = deque([('', tree_sha, True)])
+    requests_left = _SUBTREE_FETCH_LIMIT
+    while pending:
+        if requests_left <= 0:
+            index.truncated = True
+            logger.warning(f"Git tree for {repo} still incomplete after {_SUBTREE_FETCH_LIMIT} subtree requests")
+            break
+        prefix, sha, known_truncated = pending.popleft()
+        requests_left -= 1
+        if not known_truncated:
+            sub = _fetch_tree(client, repo, sha, recursive=True)
+            if sub and 'tree' in sub and not sub.get('truncated'):
+                index.extend(sub['tree'], prefix)
+                continue
+        sub = _fetch_tree(client, repo, sha, recursive=False)
+        if not sub or 'tree' not in sub:
+            index.truncated = True
+            continue
+        for item in sub['tree']:
+            index.add(prefix + item['path'], item.get('type') == 'blob', item.get('size'))
+            if item.get('type') == 'tree' and item.get('sha'):
+                pending.append((f"{prefix}{item['path']}/", item['sha'], False))
+    return index
+
+class TreeIndexStore:
+    """
+    Tree indexes persisted by HEAD commit SHA in the cache directory, plus a
+    per-run memo by repo. TREE_INDEX=0 skips persistence and builds each index
+    from a single recursive tree listing.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or cache_path('trees')
+        self.enabled = os.environ.get('TREE_INDEX', '1') != '0'
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _path(self, commit_sha):
+        return os.path.join(self.root, commit_sha[:2], f"{commit_sha}.json")
+
+    def _load(self, commit_sha):
+        path = self._path(commit_sha)
+        data = read_json(path)
+        if not isinstance(data, dict) or data.get('commit') != commit_sha:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return TreeIndex.from_json(data)
+
+    def _build(self, client, repo):
+        commit_sha = client.get_commit_sha(repo, 'HEAD') if self.enabled else None
+        if commit_sha:
+            index = self._load(commit_sha)
+            if index is None:
+                index = _fetch_full_tree(client, repo, commit_sha)
+                if index is not None:
+                    write_json_atomic(self._path(commit_sha), {**index.to_json(), 'commit': commit_sha})
+            return index
+        data = _fetch_tree(client, repo, 'HEAD', recursive=True)
+        if data and 'tree' in data:
+            return TreeIndex.from_entries(data['tree'], sha=data.get('sha'), truncated=bool(data.get('truncated')))
+        return None
+
+    def get(self, client, repo):
+        with self._lock:
+            if repo in self._memo:
+                return self._memo[repo]
+        # Icon and source discovery for variants of one repo ask at the same time.
+        index, _ = client.inflight.do(('tree-index', repo), self._build, client, repo)
+        with self._lock:
+            self._memo[repo] = index
+        return index
+
+    def prune(self, max_age_days=30):
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
@@ -5,6 +5,10 @@ from modules.output_contracts import load_output_allowlists
 from modules.source_normalizer import normalize_source_data, save_source_if_changed, sync_and_save_apps_config
 from modules.source_io import load_existing_source, generate_combined_apps_md
 from modules.app_pipeline import process_app
+from modules.prefetch import prefetch_repo_metadata
+from modules.fingerprints import FingerprintStore
+from modules.repackage_cache import get_repackage_cache
+from modules.icons import get_icon_cache
 
 ALLOWED_APP_FIELDS, ALLOWED_VERSION_FIELDS = load_output_allowlists()
 
@@ -69,16 +73,24 @@ def update_repo_pair(
         if repo not in repo_to_base_name or len(name) < len(repo_to_base_name[repo]):
             repo_to_base_name[repo] = name
 
+    is_local_validation = os.environ.get('LOCAL_VALIDATION_ONLY') == '1'
+    fingerprints = None
+    if not is_local_validation:
+        fingerprints = FingerprintStore(os.path.join(os.path.dirname(config_file), 'fingerprints.json'))
+
+    prefetch_repo_metadata(client, [a['github_repo'] for a in apps])
+
     from concurrent.futures import ThreadPoolExecutor, as_completed
 
     new_apps_list_coex = []
     new_apps_list_orig = []
 
-    MAX_WORKERS = 5 if client.token else 2
+    MAX_WORKERS = client.default_max_workers()
 
     logger.info(f"Starting parallel update with {MAX_WORKERS} workers for {len(apps)} apps...")
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="coexist") as pass_executor:
         future_to_app = {}
         for app_config in apps:
             repo = app_config['github_repo']
@@ -90,8 +102,12 @@ def update_repo_pair(
             current_entry_orig = existing_apps_map_orig.get(key)
 
             def _process_pair(cfg=app_config, entry_coex=current_entry_coex, entry_orig=current_entry_orig, base=base_name):
-                entry_c, updates_c = process_app(cfg, entry_coex, client, base, True)
-                entry_o, updates_o = process_app(cfg, entry_orig, client, base, False)
+                # Both variants run at once so their identical release lookups, downloads
+                # and parses coalesce in the client. Each pass gets its own copy of the
+                # config because process_app may inject a tag_regex into it.
+                coex_future = pass_executor.submit(process_app, dict(cfg), entry_coex, client, base, True, fingerprints)
+                entry_o, updates_o = process_app(dict(cfg), entry_orig, client, base, False, fingerprints)
+                entry_c, updates_c = coex_future.result()
                 merged_updates = dict(updates_c or {})
                 for k, v in (updates_o or {}).items():
                     merged_updates.setdefault(k, v)
@@ -103,7 +119,6 @@ def update_repo_pair(
         for future in as_completed(future_to_app):
             name = future_to_app[future]
             try:
-                is_local_validation = os.environ.get('LOCAL_VALIDATION_ONLY') == '1'
                 timeout_s = int(os.environ.get('APP_PROCESS_TIMEOUT', '180' if is_local_validation else '900'))
                 resulting_entry_coex, resulting_entry_orig, metadata_updates = future.result(timeout=timeout_s)
 
@@ -186,6 +201,8 @@ def update_repo_pair(
     )
     source_changed_coex = save_source_if_changed(source_file_coex, normalized_source_coex, original_source_data_coex)
     source_changed_orig = save_source_if_changed(source_file_orig, normalized_source_orig, original_source_data_orig)
+    if fingerprints:
+        fingerprints.save(valid_prefixes={f"{a['github_repo']}::{a['name']}" for a in apps})
     return source_changed_coex, source_changed_orig, apps_changed
 
 def main():
@@ -288,6 +305,18 @@ def main():
         deletes = client.asset_changes.get("deleted", [])
         releases_deleted = client.asset_changes.get("releases_deleted", [])
         logger.info(f"Asset changes: uploaded={len(uploads)} deleted={len(deletes)} releases_deleted={len(releases_deleted)}")
+    if client.http_cache:
+        stats = client.http_cache_stats
+        pruned = client.http_cache.prune(max_age_days=int(os.environ.get('HTTP_CACHE_MAX_AGE_DAYS', '14')))
+        logger.info(f"HTTP cache: revalidated={stats['revalidated']} fetched={stats['fetched']} pruned={pruned}")
+    repackage_cache = get_repackage_cache()
+    if repackage_cache:
+        repackage_cache.prune(max_age_days=int(os.environ.get('REPACKAGE_CACHE_MAX_AGE_DAYS', '30')))
+    client.official_sources.prune(max_age_days=int(os.environ.get('OFFICIAL_SOURCE_CACHE_MAX_AGE_DAYS', '30')))
+    client.tree_indexes.prune(max_age_days=int(os.environ.get('TREE_CACHE_MAX_AGE_DAYS', '30')))
+    get_icon_cache().prune(max_age_days=int(os.environ.get('ICON_CACHE_MAX_AGE_DAYS', '30')))
+    evicted, freed = client.downloads.evict(max_bytes=int(os.environ.get('DOWNLOAD_CACHE_MAX_BYTES', str(1024 ** 3))))
+    logger.info(f"Download cache: evicted {evicted} files ({freed // (1024 * 1024)} MB)")
 if __name__ == "__main__":
     try:
         main()
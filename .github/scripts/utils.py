@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import sys
@@ -5,11 +6,21 @@ import re
 import tempfile
 import logging
 import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
-from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 from urllib3.util.retry import Retry
 
+from modules.blob_store import BlobStore
+from modules.cache_store import HttpCache
+from modules.rate_limit import RateLimitScheduler, ScheduledAdapter
+from modules.singleflight import SingleFlight
+from modules.tree_index import TreeIndex, TreeIndexStore
+from modules.json_probe import probe_altstore_source
+from modules.official_source_cache import OfficialSourceCache, compact_app
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -19,6 +30,8 @@ logger = logging.getLogger(__name__)
 
 REPO_PATTERN = re.compile(r'^[a-zA-Z0-9\._-]+/[a-zA-Z0-9\._-]+$')
 URL_PATTERN = re.compile(r'^https?://')
+# Releases per listing page; the GraphQL prefetch seeds page 1 at this size.
+RELEASE_PAGE_SIZE = 30
 
 def load_json(path):
     """Load JSON file safely."""
@@ -84,13 +97,29 @@ class GitHubClient:
     def __init__(self, token=None):
         self.session = requests.Session()
         retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-        self.session.mount("https://", HTTPAdapter(max_retries=retries))
+        # Keep-alive pool sized for every worker thread plus the HEAD fan-out, so
+        # connections are reused instead of discarded when the pool overflows.
+        self.pool_size = int(os.environ.get('HTTP_POOL_SIZE', '32'))
+        self.scheduler = RateLimitScheduler()
+        self.session.mount("https://", ScheduledAdapter(
+            self.scheduler, max_retries=retries, pool_connections=16, pool_maxsize=self.pool_size
+        ))
+        self._io_pool = None
+        self._probe_pool = None
+        self._io_pool_lock = threading.Lock()
         self.token = token or os.environ.get('GITHUB_TOKEN')
         self._json_cache = {}
         self._paginate_cache = {}
+        self.tree_indexes = TreeIndexStore()
+        self.official_sources = OfficialSourceCache()
+        self.inflight = SingleFlight()
         self._workflow_hint_cache = {}
-        self._download_cache = {}
-        self._download_cache_dir = tempfile.mkdtemp(prefix="download-cache-")
+        if os.environ.get('DOWNLOAD_CACHE', '1') != '0':
+            self.downloads = BlobStore()
+        else:
+            self.downloads = BlobStore(root=tempfile.mkdtemp(prefix="download-cache-"))
+        self.http_cache = HttpCache() if os.environ.get('HTTP_CACHE', '1') != '0' else None
+        self.http_cache_stats = {"revalidated": 0, "fetched": 0}
         self.asset_changes = {
             "deleted": [],
             "uploaded": [],
@@ -135,6 +164,8 @@ class GitHubClient:
             if not self._is_api_url(url):
                 headers.pop('Authorization', None)
 
+            headers.update(kwargs.pop('headers', None) or {})
+
             timeout = kwargs.pop('timeout', 30)
             resp = self.session.get(url, headers=headers, params=params, timeout=timeout, **kwargs)
             resp.raise_for_status()
@@ -159,36 +190,62 @@ class GitHubClient:
         items = [f"{k}={params[k]}" for k in sorted(params.keys())]
         return f"{url}?{'&'.join(items)}"
 
-    def get_cached_download(self, key):
-        path = self._download_cache.get(key)
-        if path and os.path.exists(path):
-            return path
-        return None
+    def checkout_download(self, key, out_path, validator=None):
+        """Link a cached download to out_path. Returns its sha256, or None if nothing reusable is cached."""
+        try:
+            return self.downloads.checkout(key, out_path, validator)
+        except Exception as e:
+            logger.debug(f"Download cache checkout failed for {key}: {e}")
+            return None
 
-    def cache_download_file(self, key, source_path, suffix=None):
+    def cache_download_file(self, key, source_path, sha256, validator=None):
         if not source_path or not os.path.exists(source_path):
             return None
-        if key in self._download_cache and os.path.exists(self._download_cache[key]):
-            return self._download_cache[key]
-        suffix = suffix or os.path.splitext(source_path)[1]
-        filename = re.sub(r'[^a-zA-Z0-9._-]+', '_', key)
-        cache_path = os.path.join(self._download_cache_dir, f"{filename}{suffix}")
         try:
-            shutil.copy2(source_path, cache_path)
-            self._download_cache[key] = cache_path
-            return cache_path
-        except Exception:
+            return self.downloads.put(key, source_path, sha256, validator)
+        except Exception as e:
+            logger.debug(f"Download cache store failed for {key}: {e}")
             return None
 
     def _get_json_cached(self, url, params=None, suppress_not_found_log=False):
         key = self._cache_key(url, params)
         if key in self._json_cache:
             return self._json_cache[key]
-        resp = self.get(url, params=params, suppress_not_found_log=suppress_not_found_log)
-        data = resp.json() if resp else None
+        # Variants of one repo processed in parallel ask for the same documents at once.
+        data, _ = self.inflight.do(('json', key), self._get_json_revalidated, url, params=params,
+                                   suppress_not_found_log=suppress_not_found_log)
         self._json_cache[key] = data
         return data
 
+    def _get_json_revalidated(self, url, params=None, suppress_not_found_log=False):
+        """GET a JSON document, revalidating any persisted copy with a conditional request (304s are free)."""
+        key = self._cache_key(url, params)
+        entry = self.http_cache.load(key) if self.http_cache else None
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        resp = self.get(url, params=params, suppress_not_found_log=suppress_not_found_log, headers=headers)
+        if not resp:
+            return None
+        if resp.status_code == 304 and entry:
+            self.http_cache.touch(key)
+            self.http_cache_stats["revalidated"] += 1
+            return entry.get('body')
+
+        data = resp.json()
+        self.http_cache_stats["fetched"] += 1
+        if self.http_cache:
+            self.http_cache.store(
+                key, data,
+                etag=resp.headers.get('ETag'),
+                last_modified=resp.headers.get('Last-Modified'),
+            )
+        return data
+
     def _is_api_url(self, url):
         """Check if URL is a GitHub API endpoint (vs CDN/download URL that rejects auth)."""
         return 'api.github.com' in url or 'uploads.github.com' in url
@@ -206,52 +263,124 @@ class GitHubClient:
             logger.error(f"HEAD request failed: {url} - {e}")
             return None
 
+    def io_pool(self):
+        """Shared thread pool for fanning out small independent requests."""
+        with self._io_pool_lock:
+            if self._io_pool is None:
+                self._io_pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="io")
+        return self._io_pool
+
+    def probe_pool(self):
+        """
+        Bounded pool for official-source probes. Probes abandoned at the discovery
+        deadline finish here instead of holding io_pool slots.
+        """
+        with self._io_pool_lock:
+            if self._probe_pool is None:
+                workers = int(os.environ.get('OFFICIAL_SOURCE_PROBE_WORKERS', '8'))
+                self._probe_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="probe")
+        return self._probe_pool
+
+    def head_many(self, urls, **kwargs):
+        """Issue HEAD requests for several URLs concurrently. Returns {url: response or None}."""
+        urls = list(dict.fromkeys(u for u in urls if u))
+        if len(urls) <= 1:
+            return {u: self.head(u, **kwargs) for u in urls}
+        pool = self.io_pool()
+        futures = {u: pool.submit(self.head, u, **kwargs) for u in urls}
+        return {u: f.result() for u, f in futures.items()}
+
+    def default_max_workers(self):
+        """Worker count for the app pool, sized from the remaining API budget unless UPDATE_MAX_WORKERS is set."""
+        configured = os.environ.get('UPDATE_MAX_WORKERS')
+        if configured:
+            return max(1, int(configured))
+        if self.scheduler.api_remaining() is None:
+            # /rate_limit itself is free; the scheduler picks up its X-RateLimit-* headers.
+            self.get("https://api.github.com/rate_limit", timeout=10)
+        return self.scheduler.recommended_workers(floor=2 if not self.token else 5)
+
+    def graphql(self, query, variables=None, timeout=60):
+        """Run a GraphQL query. Returns the response document (which may carry partial errors) or None."""
+        if not self.token:
+            return None
+        try:
+            resp = self.session.post(
+                "https://api.github.com/graphql",
+                headers=self.headers,
+                json={"query": query, "variables": variables or {}},
+                timeout=timeout,
+            )
+            resp.raise_for_status()
+            result = resp.json()
+        except Exception as e:
+            logger.warning(f"GraphQL request failed: {e}")
+            return None
+        if result.get('errors'):
+            logger.debug(f"GraphQL returned errors: {result['errors'][:3]}")
+        if not result.get('data'):
+            return None
+        return result
+
     def get_repo_info(self, repo):
         url = f"https://api.github.com/repos/{repo}"
         return self._get_json_cached(url)
 
+    def iter_release_pages(self, repo, per_page=RELEASE_PAGE_SIZE, max_pages=None):
+        """Yield pages of a repo's releases (newest first), fetched only as far as the caller reads."""
+        max_pages = max_pages or int(os.environ.get('RELEASE_SCAN_MAX_PAGES', '10'))
+        url = f"https://api.github.com/repos/{repo}/releases"
+        for page in range(1, max_pages + 1):
+            # Page 1 keeps the plain ?per_page= key that the GraphQL prefetch seeds.
+            params = {'per_page': per_page} if page == 1 else {'per_page': per_page, 'page': page}
+            releases = self._get_json_cached(url, params=params, suppress_not_found_log=page > 1)
+            if not releases or not isinstance(releases, list):
+                return
+            yield releases
+            if len(releases) < per_page:
+                return
+
+    def iter_releases(self, repo, per_page=RELEASE_PAGE_SIZE, max_pages=None):
+        for page in self.iter_release_pages(repo, per_page=per_page, max_pages=max_pages):
+            yield from page
+
     def get_latest_release(self, repo, prefer_pre_release=False, tag_regex=None):
         if not prefer_pre_release and not tag_regex:
             url = f"https://api.github.com/repos/{repo}/releases/latest"
             return self._get_json_cached(url)
 
-        url = f"https://api.github.com/repos/{repo}/releases?per_page=30"
-        releases = self._get_json_cached(url)
-        if not releases or not isinstance(releases, list):
-            return None
-
-        active_releases = [r for r in releases if not r.get('draft', False)]
-        if not active_releases:
-            return None
-
+        pattern = None
         if tag_regex:
             try:
                 pattern = re.compile(tag_regex, re.IGNORECASE)
-                active_releases = [r for r in active_releases if pattern.search(r.get('tag_name', ''))]
             except Exception as e:
                 logger.error(f"Invalid tag_regex '{tag_regex}': {e}")
 
-        if not active_releases:
-            return None
-
-        stable = [r for r in active_releases if not r.get('prerelease', False)]
-        pre = [r for r in active_releases if r.get('prerelease', False)]
-
         def get_date(r): return r.get('published_at') or ''
 
-        if prefer_pre_release:
-            sorted_pre = sorted(pre, key=get_date, reverse=True)
-            sorted_stable = sorted(stable, key=get_date, reverse=True)
-
-            if sorted_pre:
-                if not sorted_stable or get_date(sorted_pre[0]) >= get_date(sorted_stable[0]):
-                    return sorted_pre[0]
+        # Releases are listed newest first, so the first page holding a match holds
+        # the newest one. Without prefer_pre_release a stable match wins over any
+        # prerelease, so paging continues until one turns up (or the list ends).
+        newest_stable = None
+        newest_pre = None
+        for page in self.iter_release_pages(repo):
+            for r in page:
+                if r.get('draft', False):
+                    continue
+                if pattern and not pattern.search(r.get('tag_name', '')):
+                    continue
+                if r.get('prerelease', False):
+                    if newest_pre is None or get_date(r) > get_date(newest_pre):
+                        newest_pre = r
+                elif newest_stable is None or get_date(r) > get_date(newest_stable):
+                    newest_stable = r
+            if newest_stable or (prefer_pre_release and newest_pre):
+                break
 
-            return sorted_stable[0] if sorted_stable else (sorted_pre[0] if sorted_pre else None)
-        else:
-            if stable:
-                return sorted(stable, key=get_date, reverse=True)[0]
-            return sorted(active_releases, key=get_date, reverse=True)[0]
+        if prefer_pre_release and newest_pre:
+            if not newest_stable or get_date(newest_pre) >= get_date(newest_stable):
+                return newest_pre
+        return newest_stable or newest_pre
 
     def check_repo_exists(self, repo):
         url = f"https://api.github.com/repos/{repo}"
@@ -261,6 +390,11 @@ class GitHubClient:
         except Exception:
             return False
 
+    def get_readme(self, repo):
+        """Fetch the repository README (base64 content)."""
+        url = f"https://api.github.com/repos/{repo}/readme"
+        return self._get_json_cached(url)
+
     def get_repo_contents(self, repo, path=""):
         """Fetch contents of a path in the repo."""
         url = f"https://api.github.com/repos/{repo}/contents/{path}"
@@ -272,6 +406,10 @@ class GitHubClient:
         url = f"https://api.github.com/repos/{repo}/git/trees/{sha}{recursive_param}"
         return self._get_json_cached(url)
 
+    def get_tree_index(self, repo):
+        """TreeIndex of the repo's HEAD tree, persisted by commit SHA (None if unavailable)."""
+        return self.tree_indexes.get(self, repo)
+
     def get_workflows(self, repo):
         """Fetch all workflows for a repository."""
         url = f"https://api.github.com/repos/{repo}/actions/workflows"
@@ -281,6 +419,11 @@ class GitHubClient:
         cache_key = self._cache_key(url, {**(params or {}), "per_page": per_page, "max_pages": max_pages})
         if cache_key in self._paginate_cache:
             return list(self._paginate_cache[cache_key])
+        items, _ = self.inflight.do(('paginate', cache_key), self._paginate_pages, url, key, params, per_page, max_pages)
+        self._paginate_cache[cache_key] = list(items)
+        return list(items)
+
+    def _paginate_pages(self, url, key, params, per_page, max_pages):
         params = dict(params or {})
         params.pop('page', None)
         params.pop('per_page', None)
@@ -290,10 +433,9 @@ class GitHubClient:
             page_params = dict(params)
             page_params['per_page'] = per_page
             page_params['page'] = page
-            resp = self.get(url, params=page_params, suppress_not_found_log=True)
-            if not resp:
+            data = self._get_json_revalidated(url, params=page_params, suppress_not_found_log=True)
+            if data is None:
                 break
-            data = resp.json()
             chunk = data.get(key, []) if key else data
             if not chunk:
                 break
@@ -303,7 +445,6 @@ class GitHubClient:
                 items.append(chunk)
             if isinstance(chunk, list) and len(chunk) < per_page:
                 break
-        self._paginate_cache[cache_key] = list(items)
         return items
 
     def get_workflow_runs(self, repo, workflow_file=None, branch=None, status='success', per_page=20):
@@ -347,35 +488,85 @@ class GitHubClient:
         url = f"https://api.github.com/repos/{repo}/actions/runs/{run_id}/artifacts"
         return self._paginate(url, key='artifacts')
 
-    def download_artifact(self, repo, artifact_id):
-        """Download an artifact by ID. Returns the response content (ZIP file)."""
+    def download_artifact(self, repo, artifact_id, out_path):
+        """Stream an artifact ZIP to out_path. Returns True on success."""
+        # Artifact IDs never change content, so the ID itself validates a cached copy.
         cache_key = f"artifact:{repo}:{artifact_id}"
-        cached = self.get_cached_download(cache_key)
-        if cached:
-            try:
-                with open(cached, 'rb') as f:
-                    return f.read()
-            except Exception:
-                pass
+        validator = {'artifact_id': artifact_id}
+        if self.checkout_download(cache_key, out_path, validator):
+            return True
+        ok, leader = self.inflight.do(cache_key, self._fetch_artifact, repo, artifact_id, out_path, cache_key, validator)
+        if leader or not ok:
+            return ok
+        # Another caller fetched it into the download store meanwhile.
+        if self.checkout_download(cache_key, out_path, validator):
+            return True
+        return self._fetch_artifact(repo, artifact_id, out_path, cache_key, validator)
+
+    def _fetch_artifact(self, repo, artifact_id, out_path, cache_key, validator):
         url = f"https://api.github.com/repos/{repo}/actions/artifacts/{artifact_id}/zip"
-        resp = self.get(url, suppress_not_found_log=True)
-        content = resp.content if resp else None
-        if content:
-            try:
-                filename = f"{cache_key}.zip"
-                filename = re.sub(r'[^a-zA-Z0-9._-]+', '_', filename)
-                cache_path = os.path.join(self._download_cache_dir, filename)
-                with open(cache_path, 'wb') as f:
-                    f.write(content)
-                self._download_cache[cache_key] = cache_path
-            except Exception:
-                pass
-        return content
+        resp = self.get(url, suppress_not_found_log=True, stream=True, timeout=300)
+        if not resp:
+            return False
+        sha256 = hashlib.sha256()
+        try:
+            with open(out_path, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=1024 * 256):
+                    if chunk:
+                        f.write(chunk)
+                        sha256.update(chunk)
+        except Exception as e:
+            logger.warning(f"Artifact download interrupted for {repo}#{artifact_id}: {e}")
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            return False
+        finally:
+            resp.close()
+        self.cache_download_file(cache_key, out_path, sha256.hexdigest(), validator)
+        return True
+
+    def get_commit_sha(self, repo, ref='HEAD'):
+        """
+        Resolve ref to a commit SHA using the sha media type, so none of the commit
+        payload (file list, patches) is transferred or cached.
+        """
+        url = f"https://api.github.com/repos/{repo}/commits/{ref}"
+        key = f"{url}#sha"
+        if key in self._json_cache:
+            return self._json_cache[key]
+        sha, _ = self.inflight.do(('json', key), self._get_sha_revalidated, url, key)
+        self._json_cache[key] = sha
+        return sha
+
+    def _get_sha_revalidated(self, url, key):
+        entry = self.http_cache.load(key) if self.http_cache else None
+        headers = {'Accept': 'application/vnd.github.sha'}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        resp = self.get(url, suppress_not_found_log=True, headers=headers)
+        if not resp:
+            return None
+        if resp.status_code == 304 and entry:
+            self.http_cache.touch(key)
+            self.http_cache_stats["revalidated"] += 1
+            return entry.get('body')
+        sha = resp.text.strip()
+        if not re.fullmatch(r'[0-9a-f]{40}', sha):
+            return None
+        self.http_cache_stats["fetched"] += 1
+        if self.http_cache:
+            self.http_cache.store(key, sha, etag=resp.headers.get('ETag'))
+        return sha
 
     def get_latest_commit(self, repo, ref):
         url = f"https://api.github.com/repos/{repo}/commits/{ref}"
         return self._get_json_cached(url, suppress_not_found_log=True)
 
+    def get_release_asset(self, repo, asset_id):
+        """Fetch release asset metadata (includes the sha256 digest on current GitHub)."""
+        url = f"https://api.github.com/repos/{repo}/releases/assets/{asset_id}"
+        return self._get_json_cached(url, suppress_not_found_log=True)
+
     def get_release_by_tag(self, repo, tag):
         """Fetch a release by tag name."""
         url = f"https://api.github.com/repos/{repo}/releases/tags/{tag}"
@@ -414,7 +605,6 @@ class GitHubClient:
         url = f"https://api.github.com/repos/{repo}/releases/{release_id}"
 
         if not hasattr(self, '_body_lock'):
-            import threading
             self._body_lock = threading.Lock()
 
         with self._body_lock:
@@ -657,16 +847,18 @@ def find_best_icon(repo, client, limit=20):
     logger.info(f"Searching for icon candidates in {repo}...")
 
     try:
-        tree_data = client.get_git_tree(repo, recursive=True)
+        index = client.get_tree_index(repo)
     except Exception as e:
         logger.warning(f"Failed to fetch git tree for {repo}: {e}")
-        tree_data = None
+        index = None
 
-    if not tree_data or 'tree' not in tree_data:
+    if index is None:
         try:
             root_contents = client.get_repo_contents(repo)
             if root_contents and isinstance(root_contents, list):
-                tree_data = {'tree': [{'path': c['name'], 'type': 'blob' if c['type']=='file' else 'tree'} for c in root_contents]}
+                index = TreeIndex.from_entries(
+                    [{'path': c['name'], 'type': 'blob' if c['type']=='file' else 'tree'} for c in root_contents]
+                )
             else:
                 return []
         except Exception:
@@ -675,12 +867,10 @@ def find_best_icon(repo, client, limit=20):
     candidates = []
     valid_exts = ('.png', '.jpg', '.jpeg', '.webp', '.svg')
 
-    for item in tree_data['tree']:
-        path = item['path']
-        if path.lower().endswith(valid_exts):
-            s = score_icon_path(path)
-            if s > 0:
-                candidates.append((s, path))
+    for path, _ in index.entries(valid_exts):
+        s = score_icon_path(path)
+        if s > 0:
+            candidates.append((s, path))
 
     if not candidates:
         try:
@@ -778,17 +968,6 @@ def _score_source_candidate(path, size=None):
 
     return score
 
-def _validate_altstore_json(data):
-    """Check if parsed JSON data conforms to AltStore source schema."""
-    if not isinstance(data, dict):
-        return False
-    apps = data.get('apps')
-    if not isinstance(apps, list) or not apps:
-        return False
-    # Check first app entry for bundleIdentifier
-    first = apps[0]
-    return isinstance(first, dict) and 'bundleIdentifier' in first
-
 def _extract_json_urls_from_readme(readme_text):
     """Extract URLs to potential JSON source files from README content."""
     urls = set()
@@ -802,41 +981,93 @@ def _extract_json_urls_from_readme(readme_text):
         urls.add(url)
     return urls
 
-def find_official_source(repo, bundle_id, client):
+def _until(chunks, deadline):
+    for chunk in chunks:
+        if time.monotonic() > deadline:
+            return
+        yield chunk
+
+def _fetch_source_candidate(client, url, headers=None, timeout=10, validators=None, deadline=None):
     """
-    Auto-discover an AltStore-compatible source from a GitHub repo and extract
-    metadata for the app matching the given bundle_id.
+    GET a candidate source JSON. Returns (status, data, etag, last_modified); data
+    (apps reduced to the cached fields) only for a valid 200. The body is validated
+    while streaming, so files that are not sources are dropped after a few bytes.
+    With a deadline (time.monotonic() value) the request timeout is clamped to it
+    and a body still streaming when it passes is abandoned.
+    """
+    if deadline is not None:
+        timeout = max(0.5, min(timeout, deadline - time.monotonic()))
+    headers = dict(headers or {})
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    resp = client.session.get(url, headers=headers, timeout=timeout, stream=True)
+    if resp is None:
+        return None, None, None, None
+    try:
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if resp.status_code != 200:
+            return resp.status_code, None, etag, last_modified
+        max_bytes = int(os.environ.get('OFFICIAL_SOURCE_MAX_BYTES', str(16 * 1024 * 1024)))
+        length = resp.headers.get('Content-Length', '')
+        if length.isdigit() and max_bytes and int(length) > max_bytes:
+            logger.debug(f"Skipping oversized source candidate {url} ({length} bytes)")
+            return resp.status_code, None, etag, last_modified
+        chunks = resp.iter_content(chunk_size=64 * 1024)
+        if deadline is not None:
+            chunks = _until(chunks, deadline)
+        data = probe_altstore_source(chunks, transform=compact_app, max_bytes=max_bytes)
+        return resp.status_code, data, etag, last_modified
+    finally:
+        resp.close()
+
+def _clean_official_bid(bundle_id):
+    clean_bid = bundle_id.replace('.coexist', '')
+    # Also strip variant tags for matching
+    for tag_suffix in ['.nightly', '.beta', '.alpha', '.dev', '.sidestore', '.hv']:
+        if clean_bid.endswith(tag_suffix):
+            clean_bid = clean_bid[:-(len(tag_suffix))]
+    return clean_bid
+
+def _source_matches(data, bundle_id):
+    clean_bid = _clean_official_bid(bundle_id)
+    return any(app.get('bundleIdentifier', '') in (clean_bid, bundle_id) for app in data.get('apps', []))
 
-    Discovery layers:
-      1. Git tree scan: score all .json files, fetch top candidates
+def _discover_official_sources(repo, client, bundle_id=None):
+    """
+    Run the discovery layers:
+      1. Git tree scan: score all .json files (via the tree index), fetch top candidates
       2. README URL extraction: parse README for .json links
       3. GitHub Pages probe: try common source paths on {owner}.github.io
 
-    Returns: dict with supplemental fields (screenshotURLs, category, subtitle, tintColor, etc.)
-             or None if no official source found.
+    All candidate URLs are probed concurrently under OFFICIAL_SOURCE_DEADLINE
+    seconds. With a bundle_id, probing stops as soon as the highest-priority
+    match is known (every earlier candidate has finished).
+
+    Returns (sources, complete): sources is a list of {url, origin, auth, etag,
+    last_modified, data} with compacted data in layer order, or None if the
+    repo itself could not be read; complete is False if probing was cut short.
     """
     logger.info(f"Searching for official AltStore source in {repo}...")
+    started = time.monotonic()
 
     repo_info = client.get_repo_info(repo)
     if not repo_info:
-        return None
+        return None, False
     default_branch = repo_info.get('default_branch', 'main')
     owner = repo.split('/')[0]
     repo_name = repo.split('/')[1]
 
-    validated_sources = []  # list of (source_dict, origin_label)
+    probes = []  # (layer, url, origin, auth, timeout, log message)
 
     # --- Layer 1: Git tree scan ---
-    tree_data = client.get_git_tree(repo, recursive=True)
-    if tree_data and 'tree' in tree_data:
+    index = client.get_tree_index(repo)
+    if index is not None:
         candidates = []
-        for item in tree_data['tree']:
-            if item.get('type') != 'blob':
-                continue
-            path = item['path']
-            if not path.lower().endswith('.json'):
-                continue
-            size = item.get('size', None)
+        for path, size in index.entries(('.json',), blobs_only=True):
             score = _score_source_candidate(path, size)
             if score > -50:
                 candidates.append((score, path, size))
@@ -845,35 +1076,18 @@ def find_official_source(repo, bundle_id, client):
 
         for score, path, size in candidates[:5]:
             raw_url = f"https://raw.githubusercontent.com/{repo}/{default_branch}/{path}"
-            try:
-                resp = client.session.get(raw_url, headers=client.headers, timeout=10)
-                if resp and resp.status_code == 200:
-                    data = resp.json()
-                    if _validate_altstore_json(data):
-                        logger.info(f"Found AltStore source in repo: {path} (score={score})")
-                        validated_sources.append((data, f"repo:{path}"))
-            except Exception:
-                continue
+            probes.append(('tree', raw_url, f"repo:{path}", True, 10,
+                           f"Found AltStore source in repo: {path} (score={score})"))
 
     # --- Layer 2: README URL extraction ---
     try:
-        readme_url = f"https://api.github.com/repos/{repo}/readme"
-        resp = client.get(readme_url)
-        if resp:
-            readme_data = resp.json()
+        readme_data = client.get_readme(repo)
+        if readme_data:
             import base64
             readme_text = base64.b64decode(readme_data.get('content', '')).decode('utf-8', errors='ignore')
-            json_urls = _extract_json_urls_from_readme(readme_text)
-            for url in json_urls:
-                try:
-                    resp2 = client.session.get(url, timeout=10)
-                    if resp2 and resp2.status_code == 200:
-                        data = resp2.json()
-                        if _validate_altstore_json(data):
-                            logger.info(f"Found AltStore source from README: {url}")
-                            validated_sources.append((data, f"readme:{url}"))
-                except Exception:
-                    continue
+            for url in sorted(_extract_json_urls_from_readme(readme_text)):
+                probes.append(('readme', url, f"readme:{url}", False, 10,
+                               f"Found AltStore source from README: {url}"))
     except Exception:
         pass
 
@@ -883,29 +1097,165 @@ def find_official_source(repo, bundle_id, client):
                    'api/source.json', 'api/apps.json']
     for p in pages_paths:
         url = f"{pages_base}/{p}"
+        probes.append(('pages', url, f"pages:{url}", False, 8,
+                       f"Found AltStore source on GitHub Pages: {url}"))
+
+    prep_elapsed = time.monotonic() - started
+    deadline = started + float(os.environ.get('OFFICIAL_SOURCE_DEADLINE', '20'))
+
+    def _probe(probe):
+        t0 = time.monotonic()
         try:
-            resp = client.session.get(url, timeout=8)
-            if resp and resp.status_code == 200:
-                data = resp.json()
-                if _validate_altstore_json(data):
-                    logger.info(f"Found AltStore source on GitHub Pages: {url}")
-                    validated_sources.append((data, f"pages:{url}"))
+            fetched = _fetch_source_candidate(client, probe[1], headers=client.headers if probe[3] else None,
+                                              timeout=probe[4], deadline=deadline)
         except Exception:
+            fetched = (None, None, None, None)
+        return fetched, time.monotonic() - t0
+
+    pool = client.probe_pool()
+    futures = {pool.submit(_probe, probe): i for i, probe in enumerate(probes)}
+    results = {}
+    matched_at = None
+    complete = True
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            complete = False
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = futures[future]
+            results[i] = future.result()
+            data = results[i][0][1]
+            if bundle_id and data is not None and _source_matches(data, bundle_id):
+                matched_at = i if matched_at is None else min(matched_at, i)
+        if matched_at is not None and all(i in results for i in range(matched_at)):
+            complete = not pending
+            break
+    for future in pending:
+        future.cancel()
+    if pending and not complete:
+        logger.info(f"Stopped {len(pending)} official source probes early for {repo}")
+
+    validated_sources = []
+    layer_latency = {}
+    for i, probe in enumerate(probes):
+        if i not in results:
+            continue
+        layer, url, origin, auth, _, message = probe
+        (status, data, etag, last_modified), elapsed = results[i]
+        layer_latency[layer] = max(layer_latency.get(layer, 0.0), elapsed)
+        if data is None:
             continue
+        logger.info(message)
+        validated_sources.append({
+            'url': url, 'origin': origin, 'auth': auth,
+            'etag': etag, 'last_modified': last_modified,
+            'data': data,
+        })
+
+    latency = ' '.join(f"{layer}={layer_latency[layer]:.2f}s" for layer in ('tree', 'readme', 'pages') if layer in layer_latency)
+    logger.info(
+        f"Official source discovery for {repo}: {len(results)}/{len(probes)} probes, "
+        f"setup={prep_elapsed:.2f}s {latency} total={time.monotonic() - started:.2f}s"
+    )
+    return validated_sources, complete
+
+def _revalidate_official_sources(client, sources):
+    """Conditionally re-fetch cached sources. Returns (still-valid sources, whether anything changed)."""
+    kept = []
+    changed = False
+    for source in sources:
+        try:
+            status, data, etag, last_modified = _fetch_source_candidate(
+                client, source['url'],
+                headers=client.headers if source.get('auth') else None,
+                validators=source,
+            )
+        except Exception:
+            status, data = None, None
+        if status == 304:
+            kept.append(source)
+        elif data is not None:
+            kept.append({**source, 'etag': etag, 'last_modified': last_modified, 'data': data})
+            changed = True
+        elif status is None or status >= 500:
+            # Transient failure: keep the cached copy.
+            kept.append(source)
+        else:
+            changed = True
+    return kept, changed
+
+def _store_official_sources(cache, repo, sources, complete):
+    # A discovery that timed out without finding anything is not a reliable negative.
+    if sources is None or not cache.enabled or (not sources and not complete):
+        return
+    cache.store(repo, sources, complete=complete)
+
+def _official_sources_for(repo, client, bundle_id=None):
+    """Returns (sources, complete) from the run memo, the persistent cache or a fresh discovery."""
+    cache = client.official_sources
+    memo = cache.memo_get(repo)
+    if memo is not None:
+        return memo
+
+    entry, fresh = cache.load(repo) if cache.enabled else (None, False)
+    complete = True
+    if entry and fresh and not entry['sources']:
+        logger.debug(f"No official AltStore source for {repo} (cached)")
+        sources = []
+    elif entry and fresh:
+        complete = entry.get('complete', True)
+        sources, changed = _revalidate_official_sources(client, entry['sources'])
+        if not sources:
+            sources, complete = _discover_official_sources(repo, client, bundle_id)
+            _store_official_sources(cache, repo, sources, complete)
+        elif changed and cache.enabled:
+            cache.store(repo, sources, discovered_at=entry.get('discovered_at'), complete=complete)
+    else:
+        sources, complete = _discover_official_sources(repo, client, bundle_id)
+        _store_official_sources(cache, repo, sources, complete)
+
+    if sources is None:
+        return None, False
+    cache.memo_set(repo, (sources, complete))
+    return sources, complete
+
+def find_official_source(repo, bundle_id, client):
+    """
+    Auto-discover an AltStore-compatible source from a GitHub repo and extract
+    metadata for the app matching the given bundle_id.
 
+    Discovery (see _discover_official_sources) runs once per repo and is cached
+    across runs: found sources are revalidated with conditional requests, and
+    repos without one are not searched again until the negative TTL expires.
+
+    Returns: dict with supplemental fields (screenshotURLs, category, subtitle, tintColor, etc.)
+             or None if no official source found.
+    """
+    cache = client.official_sources
+    validated_sources, complete = _official_sources_for(repo, client, bundle_id)
+    if (validated_sources and not complete
+            and not any(_source_matches(s['data'], bundle_id) for s in validated_sources)
+            and not cache.has_recent_miss(repo, bundle_id)):
+        # Probing stopped early for another bundle ID (or hit the deadline); look again in full.
+        validated_sources, complete = _discover_official_sources(repo, client)
+        if validated_sources is not None:
+            _store_official_sources(cache, repo, validated_sources, complete)
+            cache.memo_set(repo, (validated_sources, complete))
+            if not any(_source_matches(s['data'], bundle_id) for s in validated_sources):
+                cache.record_miss(repo, bundle_id)
     if not validated_sources:
         logger.debug(f"No official AltStore source found for {repo}")
         return None
 
     # --- Match by bundleIdentifier ---
-    clean_bid = bundle_id.replace('.coexist', '')
-    # Also strip variant tags for matching
-    for tag_suffix in ['.nightly', '.beta', '.alpha', '.dev', '.sidestore', '.hv']:
-        if clean_bid.endswith(tag_suffix):
-            clean_bid = clean_bid[:-(len(tag_suffix))]
+    clean_bid = _clean_official_bid(bundle_id)
 
     supplemental = {}
-    for source_data, origin in validated_sources:
+    for source in validated_sources:
+        source_data, origin = source['data'], source['origin']
         for app in source_data.get('apps', []):
             app_bid = app.get('bundleIdentifier', '')
             if app_bid == clean_bid or app_bid == bundle_id: